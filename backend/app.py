@@ -3,13 +3,20 @@ Study Eyes - Main Flask Application
 AI-powered application for monitoring student focus and attention during study sessions
 """
 
+# Patch the standard library before anything else imports sockets or threads
+import eventlet
+eventlet.monkey_patch()
+
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_socketio import SocketIO
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 import os
+import sqlite3
 from datetime import timedelta
 import threading
 from dotenv import load_dotenv
@@ -18,13 +25,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Import configurations
-from config.config import Config
-
-# Import routes
-from routes.auth_routes import auth_bp
-from routes.session_routes import session_bp
-from routes.analytics_routes import analytics_bp
-from routes.user_routes import user_bp
+from config.config import config as config_map
 
 # Import models
 from models.database import db
@@ -32,40 +33,72 @@ from models.database import db
 # Import utilities
 from utils.logger import setup_logging
 from utils.error_handler import setup_error_handlers
+from utils.cache import is_token_revoked
+from utils.serialization import OrjsonProvider
+
+# Frontend origins allowed for both HTTP (Flask-CORS) and WebSocket handshakes
+ALLOWED_ORIGINS = frozenset([
+    'http://localhost:3000',
+    'http://localhost:5173',
+    'http://localhost:5174',
+    'http://localhost:5000'
+])
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL and relaxed fsync for SQLite so commits don't block on disk flushes"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')
+    cursor.close()
 
 def create_app(config_name='development'):
     """Application factory pattern"""
     app = Flask(__name__)
     
     # Load configuration
-    if config_name == 'testing':
-        from config.config import TestingConfig
-        app.config.from_object(TestingConfig)
-    elif config_name == 'production':
-        from config.config import ProductionConfig
-        app.config.from_object(ProductionConfig)
-    else:
-        app.config.from_object(Config)
+    app.config.from_object(config_map.get(config_name, config_map['default']))
+    
+    # Serialize every jsonify() response with orjson
+    app.json = OrjsonProvider(app)
       # Setup logging
     setup_logging(app)
     app.logger.info(f"Starting Study Eyes application in {config_name} mode")
     
     # Initialize extensions
-    CORS(app, origins=['http://localhost:3000', 'http://localhost:5173', 'http://localhost:5174', 'http://localhost:5000'])  # Frontend URLs
+    CORS(app, origins=sorted(ALLOWED_ORIGINS))  # Frontend URLs
     db.init_app(app)
     migrate = Migrate(app, db)
     
     # Initialize SocketIO
-    socketio = SocketIO(app, cors_allowed_origins=['http://localhost:3000', 'http://localhost:5173', 'http://localhost:5174', 'http://localhost:5000'], async_mode='threading')
+    socketio = SocketIO(app, cors_allowed_origins=ALLOWED_ORIGINS, async_mode='eventlet')
     
-    # JWT Configuration
-    app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'study-eyes-secret-key')
+    # JWT Configuration (key pre-encoded so PyJWT skips str -> bytes on every verify)
+    app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'study-eyes-secret-key').encode('utf-8')
+    app.config['JWT_ALGORITHM'] = 'HS256'
+    app.config['JWT_DECODE_ALGORITHMS'] = ['HS256']
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
     jwt = JWTManager(app)
     
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return is_token_revoked(jwt_payload['jti'])
+    
     # Setup error handlers
     setup_error_handlers(app)
-      # Register blueprints
+    # Import routes here so tooling that only needs the module (migrations,
+    # test collection) does not pay for the route and model import graph
+    from routes.auth_routes import auth_bp
+    from routes.session_routes import session_bp
+    from routes.analytics_routes import analytics_bp
+    from routes.user_routes import user_bp
+    
+    # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(session_bp, url_prefix='/api/sessions')
     app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
@@ -88,10 +121,22 @@ def create_app(config_name='development'):
     app.logger.info("Application setup completed successfully")
     return app, socketio
 
-# Create the application instance
-app, socketio = create_app()
+# Default application instance, created lazily so importing this module for
+# create_app() (tests, wsgi.py) does not also build a development app
+_default_app = None
+
+def __getattr__(name):
+    """Create the default application instance on first access (PEP 562)"""
+    global _default_app
+    if name in ('app', 'socketio'):
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app[0] if name == 'app' else _default_app[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
+    app, socketio = create_app()
+    
     with app.app_context():
         # Create database tables
         db.create_all()
@@ -0,0 +1,35 @@
+"""Allow at most one analytics row per user and day
+
+Revision ID: a7d2e9c4b318
+Revises: e4a7c9f1b256
+Create Date: 2026-10-16 21:04:52.118640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2e9c4b318'
+down_revision = 'e4a7c9f1b256'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Racing rollups could insert the same day twice; keep each day's newest row
+    op.execute(
+        "DELETE FROM user_analytics WHERE id NOT IN ("
+        "SELECT max(id) FROM user_analytics GROUP BY user_id, date)"
+    )
+
+    # The unique index replaces the plain one and makes a second insert fail
+    with op.batch_alter_table('user_analytics', schema=None) as batch_op:
+        batch_op.drop_index('ix_ua_user_date')
+        batch_op.create_index('ux_ua_user_date', ['user_id', 'date'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('user_analytics', schema=None) as batch_op:
+        batch_op.drop_index('ux_ua_user_date')
+        batch_op.create_index('ix_ua_user_date', ['user_id', 'date'], unique=False)
@@ -0,0 +1,32 @@
+"""Add composite indexes for per-user analytics and session lookups
+
+Revision ID: b3d9e41f5a27
+Revises: 7ac6ae06dd54
+Create Date: 2026-10-16 10:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d9e41f5a27'
+down_revision = '7ac6ae06dd54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_analytics', schema=None) as batch_op:
+        batch_op.create_index('ix_ua_user_date', ['user_id', 'date'], unique=False)
+
+    with op.batch_alter_table('study_sessions', schema=None) as batch_op:
+        batch_op.create_index('ix_ss_user_start', ['user_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('study_sessions', schema=None) as batch_op:
+        batch_op.drop_index('ix_ss_user_start')
+
+    with op.batch_alter_table('user_analytics', schema=None) as batch_op:
+        batch_op.drop_index('ix_ua_user_date')
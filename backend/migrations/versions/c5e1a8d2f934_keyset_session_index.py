@@ -0,0 +1,33 @@
+"""Index study sessions for keyset pagination
+
+Revision ID: c5e1a8d2f934
+Revises: b3d9e41f5a27
+Create Date: 2026-10-16 14:03:52.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e1a8d2f934'
+down_revision = 'b3d9e41f5a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Supersedes ix_ss_user_start: same prefix, plus id as the keyset tie-breaker
+    with op.batch_alter_table('study_sessions', schema=None) as batch_op:
+        batch_op.drop_index('ix_ss_user_start')
+        batch_op.create_index(
+            'ix_ss_user_start_id',
+            ['user_id', sa.text('start_time DESC'), sa.text('id DESC')],
+            unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('study_sessions', schema=None) as batch_op:
+        batch_op.drop_index('ix_ss_user_start_id')
+        batch_op.create_index('ix_ss_user_start', ['user_id', 'start_time'], unique=False)
@@ -0,0 +1,42 @@
+"""Allow at most one active study session per user
+
+Revision ID: d8f2b6c4e013
+Revises: c5e1a8d2f934
+Create Date: 2026-10-16 16:41:27.530219
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f2b6c4e013'
+down_revision = 'c5e1a8d2f934'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Older rows could break the invariant; keep only each user's newest active session active
+    # and cancel the rest, so status never claims a session is still running
+    op.execute(
+        "UPDATE study_sessions SET is_active = false, "
+        "status = CASE WHEN status IN ('completed', 'cancelled') THEN status ELSE 'cancelled' END "
+        "WHERE is_active AND id NOT IN ("
+        "SELECT max(id) FROM study_sessions WHERE is_active GROUP BY user_id)"
+    )
+
+    # Partial unique index: answers the active-session probe and rejects a second active row
+    with op.batch_alter_table('study_sessions', schema=None) as batch_op:
+        batch_op.create_index(
+            'ux_ss_active_user',
+            ['user_id'],
+            unique=True,
+            postgresql_where=sa.text('is_active'),
+            sqlite_where=sa.text('is_active')
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('study_sessions', schema=None) as batch_op:
+        batch_op.drop_index('ux_ss_active_user')
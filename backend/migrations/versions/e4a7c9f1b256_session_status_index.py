@@ -0,0 +1,31 @@
+"""Index study sessions by user and status for filtered listings
+
+Revision ID: e4a7c9f1b256
+Revises: d8f2b6c4e013
+Create Date: 2026-10-16 18:12:05.641873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c9f1b256'
+down_revision = 'd8f2b6c4e013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Serves ?status= listings in keyset order without filtering the user's other sessions
+    with op.batch_alter_table('study_sessions', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_ss_user_status_start',
+            ['user_id', 'status', sa.text('start_time DESC'), sa.text('id DESC')],
+            unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('study_sessions', schema=None) as batch_op:
+        batch_op.drop_index('ix_ss_user_status_start')
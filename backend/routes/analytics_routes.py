@@ -2,23 +2,206 @@
 Analytics routes for user insights and reporting
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models.database import db
 from models.user import User
 from models.session import StudySession
 from models.analytics import UserAnalytics
-from datetime import datetime, timedelta
-from sqlalchemy import func, desc
+from datetime import datetime, date, timedelta
+from sqlalchemy import func, desc, select
+import calendar
+import csv
+import io
+import numpy as np
+from utils.cache import cache_get_raw, cache_set_raw, dashboard_key
+from utils.serialization import fast_jsonify, fast_dumps
+from utils.helpers import compile_dict_builder
+from services.analytics_tasks import get_or_create_daily_analytics
 
 analytics_bp = Blueprint('analytics', __name__)
 
+# Aggregates shared by the weekly and monthly rollups
+_ROLLUP_COLUMNS = (
+    func.coalesce(func.sum(UserAnalytics.total_study_time), 0).label('total_study_time'),
+    func.coalesce(func.sum(UserAnalytics.total_sessions), 0).label('total_sessions'),
+    func.coalesce(func.sum(UserAnalytics.completed_sessions), 0).label('completed_sessions'),
+    func.coalesce(func.avg(UserAnalytics.average_focus_percentage), 0).label('average_focus_percentage'),
+    func.coalesce(func.avg(UserAnalytics.productivity_score), 0).label('productivity_score'),
+    func.coalesce(func.sum(UserAnalytics.total_breaks), 0).label('total_breaks'),
+    func.count(UserAnalytics.id).label('days')
+)
+
+# Columns for the dashboard's recent-session cards, matching the frontend StudySession shape
+_RECENT_SESSION_COLS = (
+    StudySession.id,
+    StudySession.start_time,
+    StudySession.end_time,
+    StudySession.actual_duration.label('duration'),
+    StudySession.status,
+    StudySession.focus_percentage,
+    StudySession.average_attention_score,
+    StudySession.blink_rate,
+    StudySession.posture_score,
+    StudySession.fatigue_level,
+    StudySession.break_count,
+    StudySession.is_active
+)
+
+_recent_session_dict = compile_dict_builder(
+    [column.key for column in _RECENT_SESSION_COLS],
+    iso_fields=('start_time', 'end_time')
+)
+
+def _recent_sessions(user_id, limit=5):
+    """Latest sessions as plain dicts, read as rows without loading ORM objects"""
+    rows = db.session.execute(
+        select(*_RECENT_SESSION_COLS)
+        .where(StudySession.user_id == user_id)
+        .order_by(desc(StudySession.start_time))
+        .limit(limit)
+    )
+    return [_recent_session_dict(row) for row in rows]
+
+# Columns written to CSV exports, in order
+_EXPORT_COLUMNS = (
+    'date', 'total_study_time', 'total_sessions', 'completed_sessions', 'cancelled_sessions',
+    'total_breaks', 'average_session_duration', 'average_focus_percentage', 'average_attention_score',
+    'average_blink_rate', 'average_posture_score', 'average_fatigue_level', 'total_distractions',
+    'productivity_score', 'focus_streak_minutes'
+)
+
+def _copy_analytics_csv(user_id, start_date, end_date):
+    """Export a user's analytics as CSV bytes using Postgres COPY ... TO STDOUT"""
+    cursor = db.session.connection().connection.cursor()
+    try:
+        query = cursor.mogrify(
+            f"SELECT {', '.join(_EXPORT_COLUMNS)} FROM user_analytics "
+            "WHERE user_id = %s AND date BETWEEN %s AND %s ORDER BY date",
+            (user_id, start_date, end_date)
+        ).decode('utf-8')
+        
+        output = io.BytesIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", output)
+        return output.getvalue()
+    finally:
+        cursor.close()
+
+def _parse_date(value):
+    """Parse a date query parameter given as an ISO date or full ISO timestamp"""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return datetime.fromisoformat(value).date()
+
+def _week_start_expr(column):
+    """SQL expression mapping a date column to the Monday of its week"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.date(func.date_trunc('week', column))
+    # SQLite: jump forward to Sunday, then back to that week's Monday
+    return func.date(column, 'weekday 0', '-6 days')
+
+def _weekly_rollup(user_id, start, end):
+    """Aggregate daily analytics per week in one query, keyed by week start date"""
+    week_start = _week_start_expr(UserAnalytics.date).label('week_start')
+    rows = db.session.query(week_start, *_ROLLUP_COLUMNS).filter(
+        UserAnalytics.user_id == user_id,
+        UserAnalytics.date >= start,
+        UserAnalytics.date <= end
+    ).group_by(week_start).order_by(week_start).all()
+    
+    # SQLite hands back ISO strings, Postgres hands back dates
+    return {
+        date.fromisoformat(row.week_start) if isinstance(row.week_start, str) else row.week_start: row
+        for row in rows
+    }
+
+def _insight_stats(analytics):
+    """Summary statistics for insights, computed column-wise over the rows"""
+    n = len(analytics)
+    focus = np.fromiter((a.average_focus_percentage for a in analytics), dtype=np.float64, count=n)
+    productivity = np.fromiter((a.productivity_score for a in analytics), dtype=np.float64, count=n)
+    
+    # Integer columns as one (n, 4) block: study time, sessions, completed, breaks
+    counts = np.array(
+        [(a.total_study_time, a.total_sessions, a.completed_sessions, a.total_breaks) for a in analytics],
+        dtype=np.int64
+    ).reshape(n, 4).sum(axis=0)
+    
+    # Focus delta between the latest week and the week before it
+    focus_trend = focus[-7:].mean() - focus[-14:-7].mean() if n >= 14 else None
+    
+    return {
+        'avg_focus': float(focus.mean()),
+        'avg_productivity': float(productivity.mean()),
+        'total_study_time': int(counts[0]),
+        'total_sessions': int(counts[1]),
+        'completed_sessions': int(counts[2]),
+        'total_breaks': int(counts[3]),
+        'focus_trend': focus_trend
+    }
+
+def _rollup_totals(row, **fields):
+    """Build the totals dict for an aggregate row, zero-filled when there is no data"""
+    if row is None or not row.days:
+        return dict(fields, total_study_time=0, total_sessions=0, completed_sessions=0,
+                    average_focus_percentage=0, productivity_score=0, total_breaks=0)
+    
+    return dict(
+        fields,
+        total_study_time=int(row.total_study_time),
+        total_sessions=int(row.total_sessions),
+        completed_sessions=int(row.completed_sessions),
+        average_focus_percentage=float(row.average_focus_percentage),
+        productivity_score=float(row.productivity_score),
+        total_breaks=int(row.total_breaks)
+    )
+
+def _dashboard_today(user_id, today):
+    """Today's analytics for the dashboard, calculated on first request of the day"""
+    today_analytics, created = get_or_create_daily_analytics(user_id, today)
+    
+    if created:
+        today_analytics.calculate_daily_metrics()
+    
+    return today_analytics.to_dict()
+
+def _dashboard_active_session(user_id):
+    """The user's current active session, if any"""
+    active_session = StudySession.query.filter_by(
+        user_id=user_id, 
+        is_active=True
+    ).first()
+    
+    return active_session.to_dict() if active_session else None
+
+def _dashboard_weekly_totals(user_id, today):
+    """This week's totals for the dashboard"""
+    week_start = today - timedelta(days=today.weekday())
+    week_analytics = UserAnalytics.get_weekly_analytics(user_id, week_start)
+    
+    # Calculate weekly totals in a single pass
+    study_time = sessions = focus = productivity = 0
+    for a in week_analytics:
+        study_time += a['total_study_time']
+        sessions += a['total_sessions']
+        focus += a['average_focus_percentage']
+        productivity += a['productivity_score']
+    
+    days = len(week_analytics)
+    return {
+        'total_study_time': study_time,
+        'total_sessions': sessions,
+        'average_focus_percentage': focus / days if days else 0,
+        'productivity_score': productivity / days if days else 0
+    }
+
 @analytics_bp.route('/dashboard/dev', methods=['GET'])
 def get_dashboard_data_dev():
     """Get dashboard analytics data for development (no auth required)"""
     try:
-        from datetime import datetime
-        today = datetime.utcnow().date()
+        now = datetime.utcnow()
+        today = now.date()
         
         # Return mock data for development
         mock_data = {
@@ -44,8 +227,8 @@ def get_dashboard_data_dev():
             'recent_sessions': [
                 {
                     'id': 1,
-                    'start_time': (datetime.utcnow() - timedelta(hours=2)).isoformat(),
-                    'end_time': (datetime.utcnow() - timedelta(minutes=30)).isoformat(),
+                    'start_time': (now - timedelta(hours=2)).isoformat(),
+                    'end_time': (now - timedelta(minutes=30)).isoformat(),
                     'duration': 90,
                     'status': 'completed',
                     'focus_percentage': 87.5,
@@ -58,8 +241,8 @@ def get_dashboard_data_dev():
                 },
                 {
                     'id': 2,
-                    'start_time': (datetime.utcnow() - timedelta(hours=6)).isoformat(),
-                    'end_time': (datetime.utcnow() - timedelta(hours=4)).isoformat(),
+                    'start_time': (now - timedelta(hours=6)).isoformat(),
+                    'end_time': (now - timedelta(hours=4)).isoformat(),
                     'duration': 120,
                     'status': 'completed',
                     'focus_percentage': 78.3,
@@ -86,46 +269,20 @@ def get_dashboard_data():
         user_id = get_jwt_identity()
         today = datetime.utcnow().date()
         
-        # Get today's analytics
-        today_analytics = UserAnalytics.query.filter_by(
-            user_id=user_id, 
-            date=today
-        ).first()
-        
-        if not today_analytics:
-            today_analytics = UserAnalytics(user_id=user_id, date=today)
-            db.session.add(today_analytics)
-            today_analytics.calculate_daily_metrics()
-        
-        # Get current active session
-        active_session = StudySession.query.filter_by(
-            user_id=user_id, 
-            is_active=True
-        ).first()
-        
-        # Get this week's data
-        week_start = today - timedelta(days=today.weekday())
-        week_analytics = UserAnalytics.get_weekly_analytics(user_id, week_start)
-        
-        # Calculate weekly totals
-        weekly_totals = {
-            'total_study_time': sum([a['total_study_time'] for a in week_analytics]),
-            'total_sessions': sum([a['total_sessions'] for a in week_analytics]),
-            'average_focus_percentage': sum([a['average_focus_percentage'] for a in week_analytics]) / len(week_analytics) if week_analytics else 0,
-            'productivity_score': sum([a['productivity_score'] for a in week_analytics]) / len(week_analytics) if week_analytics else 0
-        }
-        
-        # Get recent sessions
-        recent_sessions = StudySession.query.filter_by(
-            user_id=user_id
-        ).order_by(desc(StudySession.start_time)).limit(5).all()
-        
-        return jsonify({
-            'today': today_analytics.to_dict(),
-            'weekly': weekly_totals,
-            'active_session': active_session.to_dict() if active_session else None,
-            'recent_sessions': [session.to_dict() for session in recent_sessions]
-        }), 200
+        # Serve repeated polls from the cache as stored bytes, with no parse/serialize
+        # round trip; session routes drop the key on state changes
+        cache_key = dashboard_key(user_id, today)
+        body = cache_get_raw(cache_key)
+        if body is None:
+            body = fast_dumps({
+                'today': _dashboard_today(user_id, today),
+                'weekly': _dashboard_weekly_totals(user_id, today),
+                'active_session': _dashboard_active_session(user_id),
+                'recent_sessions': _recent_sessions(user_id)
+            })
+            cache_set_raw(cache_key, body, current_app.config['DASHBOARD_CACHE_TTL'])
+        
+        return Response(body, mimetype='application/json')
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch dashboard data', 'details': str(e)}), 500
@@ -145,46 +302,41 @@ def get_daily_analytics():
         # Set date range
         if date_from and date_to:
             try:
-                start_date = datetime.fromisoformat(date_from).date()
-                end_date = datetime.fromisoformat(date_to).date()
+                start_date = _parse_date(date_from)
+                end_date = _parse_date(date_to)
             except ValueError:
                 return jsonify({'error': 'Invalid date format'}), 400
         else:
             end_date = datetime.utcnow().date()
             start_date = end_date - timedelta(days=days-1)
         
-        # Get analytics data
-        analytics = UserAnalytics.query.filter(
+        # Stream analytics rows in batches, serializing each as it arrives so
+        # long ranges never hold every ORM object at once
+        stmt = select(UserAnalytics).where(
             UserAnalytics.user_id == user_id,
             UserAnalytics.date >= start_date,
             UserAnalytics.date <= end_date
-        ).order_by(UserAnalytics.date).all()
-        
-        # Fill missing dates with empty data
-        date_range = []
-        current_date = start_date
-        while current_date <= end_date:
-            date_range.append(current_date)
-            current_date += timedelta(days=1)
+        ).order_by(UserAnalytics.date).execution_options(stream_results=True)
         
-        analytics_dict = {a.date: a for a in analytics}
+        analytics_dict = {
+            a.date: a.to_dict() for a in db.session.execute(stmt).yield_per(200).scalars()
+        }
         
-        result = []
-        for date in date_range:
-            if date in analytics_dict:
-                result.append(analytics_dict[date].to_dict())
-            else:
-                # Create empty analytics for missing dates
-                empty_analytics = UserAnalytics(user_id=user_id, date=date)
-                result.append(empty_analytics.to_dict())
+        # Fill missing dates from one empty-day template rather than a transient model per day
+        empty_template = UserAnalytics(user_id=user_id, date=start_date).to_dict()
+        date_range = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        result = [
+            analytics_dict[day] if day in analytics_dict else {**empty_template, 'date': day.isoformat()}
+            for day in date_range
+        ]
         
-        return jsonify({
+        return fast_jsonify({
             'analytics': result,
             'date_range': {
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat()
+                'start_date': start_date,
+                'end_date': end_date
             }
-        }), 200
+        })
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch daily analytics', 'details': str(e)}), 500
@@ -201,40 +353,18 @@ def get_weekly_analytics():
         
         weekly_data = []
         
-        for i in range(weeks):
-            # Calculate week start date
+        if weeks > 0:
             today = datetime.utcnow().date()
-            week_start = today - timedelta(days=today.weekday() + (i * 7))
+            this_week_start = today - timedelta(days=today.weekday())
+            oldest_week_start = this_week_start - timedelta(weeks=weeks - 1)
             
-            # Get weekly analytics
-            week_analytics = UserAnalytics.get_weekly_analytics(user_id, week_start)
+            # One grouped query covers every requested week
+            rollup = _weekly_rollup(user_id, oldest_week_start, this_week_start + timedelta(days=6))
             
-            # Calculate weekly totals
-            if week_analytics:
-                weekly_totals = {
-                    'week_start': week_start.isoformat(),
-                    'total_study_time': sum([a['total_study_time'] for a in week_analytics]),
-                    'total_sessions': sum([a['total_sessions'] for a in week_analytics]),
-                    'completed_sessions': sum([a['completed_sessions'] for a in week_analytics]),
-                    'average_focus_percentage': sum([a['average_focus_percentage'] for a in week_analytics]) / len(week_analytics),
-                    'productivity_score': sum([a['productivity_score'] for a in week_analytics]) / len(week_analytics),
-                    'total_breaks': sum([a['total_breaks'] for a in week_analytics])
-                }
-            else:
-                weekly_totals = {
-                    'week_start': week_start.isoformat(),
-                    'total_study_time': 0,
-                    'total_sessions': 0,
-                    'completed_sessions': 0,
-                    'average_focus_percentage': 0,
-                    'productivity_score': 0,
-                    'total_breaks': 0
-                }
-            
-            weekly_data.append(weekly_totals)
-        
-        # Reverse to show oldest to newest
-        weekly_data.reverse()
+            # Oldest to newest
+            for i in range(weeks - 1, -1, -1):
+                week_start = this_week_start - timedelta(weeks=i)
+                weekly_data.append(_rollup_totals(rollup.get(week_start), week_start=week_start.isoformat()))
         
         return jsonify({
             'weekly_analytics': weekly_data
@@ -262,31 +392,17 @@ def get_monthly_analytics():
         # Get monthly analytics
         monthly_analytics = UserAnalytics.get_monthly_analytics(user_id, year, month)
         
-        # Calculate monthly totals
-        if monthly_analytics:
-            monthly_totals = {
-                'year': year,
-                'month': month,
-                'total_study_time': sum([a['total_study_time'] for a in monthly_analytics]),
-                'total_sessions': sum([a['total_sessions'] for a in monthly_analytics]),
-                'completed_sessions': sum([a['completed_sessions'] for a in monthly_analytics]),
-                'average_focus_percentage': sum([a['average_focus_percentage'] for a in monthly_analytics]) / len(monthly_analytics),
-                'productivity_score': sum([a['productivity_score'] for a in monthly_analytics]) / len(monthly_analytics),
-                'total_breaks': sum([a['total_breaks'] for a in monthly_analytics]),
-                'daily_breakdown': monthly_analytics
-            }
-        else:
-            monthly_totals = {
-                'year': year,
-                'month': month,
-                'total_study_time': 0,
-                'total_sessions': 0,
-                'completed_sessions': 0,
-                'average_focus_percentage': 0,
-                'productivity_score': 0,
-                'total_breaks': 0,
-                'daily_breakdown': []
-            }
+        # Calculate monthly totals in the database
+        month_start = date(year, month, 1)
+        month_end = date(year, month, calendar.monthrange(year, month)[1])
+        totals_row = db.session.query(*_ROLLUP_COLUMNS).filter(
+            UserAnalytics.user_id == user_id,
+            UserAnalytics.date >= month_start,
+            UserAnalytics.date <= month_end
+        ).one()
+        
+        monthly_totals = _rollup_totals(totals_row, year=year, month=month)
+        monthly_totals['daily_breakdown'] = monthly_analytics or []
         
         return jsonify(monthly_totals), 200
         
@@ -308,7 +424,7 @@ def get_insights():
             UserAnalytics.user_id == user_id,
             UserAnalytics.date >= start_date,
             UserAnalytics.date <= end_date
-        ).all()
+        ).order_by(UserAnalytics.date).all()
         
         if not analytics:
             return jsonify({
@@ -319,11 +435,12 @@ def get_insights():
         insights = []
         recommendations = []
         
-        # Calculate averages
-        avg_focus = sum([a.average_focus_percentage for a in analytics]) / len(analytics)
-        avg_productivity = sum([a.productivity_score for a in analytics]) / len(analytics)
-        total_study_time = sum([a.total_study_time for a in analytics])
-        total_sessions = sum([a.total_sessions for a in analytics])
+        # Calculate averages and totals
+        stats = _insight_stats(analytics)
+        avg_focus = stats['avg_focus']
+        avg_productivity = stats['avg_productivity']
+        total_study_time = stats['total_study_time']
+        total_sessions = stats['total_sessions']
         
         # Focus insights
         if avg_focus >= 80:
@@ -353,7 +470,7 @@ def get_insights():
         
         # Session completion insights
         if total_sessions > 0:
-            completed_sessions = sum([a.completed_sessions for a in analytics])
+            completed_sessions = stats['completed_sessions']
             completion_rate = (completed_sessions / total_sessions) * 100
             
             if completion_rate >= 80:
@@ -364,7 +481,7 @@ def get_insights():
                 recommendations.append("Set more realistic session durations to improve completion rates.")
         
         # Break insights
-        total_breaks = sum([a.total_breaks for a in analytics])
+        total_breaks = stats['total_breaks']
         if total_sessions > 0:
             breaks_per_session = total_breaks / total_sessions
             if breaks_per_session < 0.5:
@@ -373,18 +490,12 @@ def get_insights():
                 recommendations.append("You might be taking too many breaks. Try longer focused sessions.")
         
         # Trend analysis
-        if len(analytics) >= 7:
-            recent_week = analytics[-7:]
-            previous_week = analytics[-14:-7] if len(analytics) >= 14 else []
-            
-            if previous_week:
-                recent_avg_focus = sum([a.average_focus_percentage for a in recent_week]) / len(recent_week)
-                previous_avg_focus = sum([a.average_focus_percentage for a in previous_week]) / len(previous_week)
-                
-                if recent_avg_focus > previous_avg_focus + 5:
-                    insights.append("Your focus has improved significantly this week!")
-                elif recent_avg_focus < previous_avg_focus - 5:
-                    insights.append("Your focus has decreased this week. Consider what might be affecting concentration.")
+        focus_trend = stats['focus_trend']
+        if focus_trend is not None:
+            if focus_trend > 5:
+                insights.append("Your focus has improved significantly this week!")
+            elif focus_trend < -5:
+                insights.append("Your focus has decreased this week. Consider what might be affecting concentration.")
         
         # General recommendations
         if not recommendations:
@@ -423,11 +534,44 @@ def export_analytics():
             start_date = end_date - timedelta(days=30)
         else:
             try:
-                start_date = datetime.fromisoformat(date_from).date()
-                end_date = datetime.fromisoformat(date_to).date()
+                start_date = _parse_date(date_from)
+                end_date = _parse_date(date_to)
             except ValueError:
                 return jsonify({'error': 'Invalid date format'}), 400
         
+        if format_type == 'csv':
+            if db.session.get_bind().dialect.name == 'postgresql':
+                # Postgres formats the CSV itself; no per-row Python work
+                def generate():
+                    yield _copy_analytics_csv(user_id, start_date, end_date)
+            else:
+                # Stream rows to the client as they come off a server-side cursor
+                stmt = select(*(getattr(UserAnalytics, name) for name in _EXPORT_COLUMNS)).where(
+                    UserAnalytics.user_id == user_id,
+                    UserAnalytics.date >= start_date,
+                    UserAnalytics.date <= end_date
+                ).order_by(UserAnalytics.date).execution_options(stream_results=True)
+                
+                def generate():
+                    output = io.StringIO()
+                    writer = csv.writer(output)
+                    writer.writerow(_EXPORT_COLUMNS)
+                    for row in db.session.execute(stmt).yield_per(500):
+                        writer.writerow(row)
+                        
+                        yield output.getvalue()
+                        output.seek(0)
+                        output.truncate(0)
+                    
+                    # Header only, when there are no rows
+                    yield output.getvalue()
+            
+            return Response(
+                stream_with_context(generate()),
+                mimetype='text/csv',
+                headers={'Content-Disposition': f'attachment; filename=study_analytics_{start_date}_{end_date}.csv'}
+            )
+        
         # Get analytics data
         analytics = UserAnalytics.query.filter(
             UserAnalytics.user_id == user_id,
@@ -435,36 +579,14 @@ def export_analytics():
             UserAnalytics.date <= end_date
         ).order_by(UserAnalytics.date).all()
         
-        data = [a.to_dict() for a in analytics]
-        
-        if format_type == 'csv':
-            # Convert to CSV format
-            import csv
-            import io
-            
-            output = io.StringIO()
-            if data:
-                writer = csv.DictWriter(output, fieldnames=data[0].keys())
-                writer.writeheader()
-                writer.writerows(data)
-            
-            csv_data = output.getvalue()
-            output.close()
-            
-            return jsonify({
-                'data': csv_data,
-                'format': 'csv',
-                'filename': f'study_analytics_{start_date}_{end_date}.csv'
-            }), 200
-        else:
-            return jsonify({
-                'data': data,
-                'format': 'json',
-                'date_range': {
-                    'start_date': start_date.isoformat(),
-                    'end_date': end_date.isoformat()
-                }
-            }), 200
+        return fast_jsonify({
+            'data': [a.to_dict() for a in analytics],
+            'format': 'json',
+            'date_range': {
+                'start_date': start_date,
+                'end_date': end_date
+            }
+        })
         
     except Exception as e:
         return jsonify({'error': 'Failed to export analytics', 'details': str(e)}), 500
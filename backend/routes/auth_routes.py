@@ -2,32 +2,86 @@
 Authentication routes for user registration, login, and token management
 """
 
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt, create_access_token
 from models.database import db
 from models.user import User
+from utils.helpers import run_blocking
+from utils.cache import cache_get, cache_set, invalidate_user, invalidate_user_stats, revoke_token, user_key
 from datetime import datetime
+import time
+from sqlalchemy import select, literal
+from sqlalchemy.exc import IntegrityError
 import re
 
 auth_bp = Blueprint('auth', __name__)
 
+# Email pattern, compiled once at import
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
 def validate_email(email):
     """Validate email format"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return _EMAIL_RE.match(email) is not None
 
 def validate_password(password):
     """Validate password strength"""
     if len(password) < 8:
         return False, "Password must be at least 8 characters long"
-    if not re.search(r'[A-Z]', password):
+    
+    # One scan for all three character classes, stopping once each is seen
+    has_upper = has_lower = has_digit = False
+    for c in password:
+        if 'A' <= c <= 'Z':
+            has_upper = True
+        elif 'a' <= c <= 'z':
+            has_lower = True
+        elif c.isdecimal():
+            has_digit = True
+        else:
+            continue
+        if has_upper and has_lower and has_digit:
+            break
+    
+    if not has_upper:
         return False, "Password must contain at least one uppercase letter"
-    if not re.search(r'[a-z]', password):
+    if not has_lower:
         return False, "Password must contain at least one lowercase letter"
-    if not re.search(r'\d', password):
+    if not has_digit:
         return False, "Password must contain at least one number"
     return True, "Password is valid"
 
+def _exists(column, value):
+    """Check for a matching row without loading any of its columns"""
+    return db.session.execute(
+        select(literal(1)).where(column == value).limit(1)
+    ).scalar() is not None
+
+def issue_access_token(user_id, email, username, is_active=True):
+    """Create an access token carrying the profile fields routes can answer from without the DB"""
+    return create_access_token(
+        identity=user_id,
+        additional_claims={'email': email, 'username': username, 'is_active': is_active}
+    )
+
+def get_user_cached(user_id):
+    """Return the user's active flag and serialized profile, served from the cache when possible"""
+    key = user_key(user_id)
+    entry = cache_get(key)
+    if entry is None:
+        user = User.query.get(user_id)
+        if not user:
+            return None
+        
+        entry = {
+            'is_active': user.is_active,
+            'email': user.email,
+            'username': user.username,
+            'profile': user.to_dict()
+        }
+        cache_set(key, entry, current_app.config['USER_CACHE_TTL'])
+    
+    return entry
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new user"""
@@ -55,15 +109,9 @@ def register():
         if not is_valid:
             return jsonify({'error': message}), 400
         
-        # Check if user already exists
-        if User.query.filter_by(email=email).first():
-            return jsonify({'error': 'Email already registered'}), 409
-        
-        if User.query.filter_by(username=username).first():
-            return jsonify({'error': 'Username already taken'}), 409
-        
-        # Create new user
-        user = User(
+        # Create new user; the unique email/username indexes reject duplicates
+        user = run_blocking(
+            User,
             email=email,
             username=username,
             password=password,
@@ -72,10 +120,20 @@ def register():
         )
         
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            
+            # Only a failed insert pays for working out which field clashed
+            if _exists(User.email, email):
+                return jsonify({'error': 'Email already registered'}), 409
+            if _exists(User.username, username):
+                return jsonify({'error': 'Username already taken'}), 409
+            raise
         
         # Generate access token
-        access_token = user.get_access_token()
+        access_token = issue_access_token(user.id, user.email, user.username, user.is_active)
         
         return jsonify({
             'message': 'User registered successfully',
@@ -103,17 +161,18 @@ def login():
         # Find user by email
         user = User.query.filter_by(email=email).first()
         
-        if not user or not user.check_password(password):
+        if not user or not run_blocking(user.check_password, password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
         if not user.is_active:
             return jsonify({'error': 'Account is deactivated'}), 401
         
-        # Update last login
+        # Update last login; the cached profile carries it
         user.update_last_login()
+        invalidate_user(user.id)
         
         # Generate access token
-        access_token = user.get_access_token()
+        access_token = issue_access_token(user.id, user.email, user.username, user.is_active)
         
         return jsonify({
             'message': 'Login successful',
@@ -130,13 +189,26 @@ def get_profile():
     """Get current user profile"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         
-        if not user:
+        # Lite profile straight from the token claims (older tokens lack them)
+        claims = get_jwt()
+        if request.args.get('lite') == '1' and 'email' in claims:
+            return jsonify({
+                'user': {
+                    'id': user_id,
+                    'email': claims['email'],
+                    'username': claims['username'],
+                    'is_active': claims['is_active']
+                }
+            }), 200
+        
+        entry = get_user_cached(user_id)
+        
+        if not entry:
             return jsonify({'error': 'User not found'}), 404
         
         return jsonify({
-            'user': user.to_dict()
+            'user': entry['profile']
         }), 200
         
     except Exception as e:
@@ -166,6 +238,8 @@ def update_profile():
                 setattr(user, field, data[field])
         
         db.session.commit()
+        invalidate_user(user_id)
+        invalidate_user_stats(user_id)
         
         return jsonify({
             'message': 'Profile updated successfully',
@@ -197,7 +271,7 @@ def change_password():
         new_password = data['new_password']
         
         # Verify current password
-        if not user.check_password(current_password):
+        if not run_blocking(user.check_password, current_password):
             return jsonify({'error': 'Current password is incorrect'}), 401
         
         # Validate new password
@@ -206,8 +280,9 @@ def change_password():
             return jsonify({'error': message}), 400
         
         # Update password
-        user.set_password(new_password)
+        run_blocking(user.set_password, new_password)
         db.session.commit()
+        invalidate_user(user_id)
         
         return jsonify({
             'message': 'Password changed successfully'
@@ -223,13 +298,14 @@ def refresh_token():
     """Refresh access token"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         
-        if not user or not user.is_active:
+        # Never re-issue from claims alone: deleted or deactivated users must stop refreshing
+        entry = get_user_cached(user_id)
+        
+        if not entry or not entry['is_active']:
             return jsonify({'error': 'User not found or inactive'}), 404
         
-        # Generate new access token
-        access_token = user.get_access_token()
+        access_token = issue_access_token(user_id, entry['email'], entry['username'])
         
         return jsonify({
             'access_token': access_token
@@ -241,7 +317,10 @@ def refresh_token():
 @auth_bp.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    """Logout user (client-side token removal)"""
+    """Logout user and revoke the current token"""
+    token = get_jwt()
+    revoke_token(token['jti'], int(token['exp'] - time.time()))
+    
     return jsonify({
         'message': 'Logout successful'
     }), 200
@@ -2,504 +2,629 @@
 Session routes for managing study sessions and real-time eye tracking
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models.database import db
 from models.user import User
 from models.session import StudySession, EyeTrackingData
-from models.analytics import UserAnalytics
 from datetime import datetime, timedelta
-from sqlalchemy import desc, and_
+from types import MappingProxyType
+import sys
+import time
+from sqlalchemy import desc, and_, func, tuple_, select, update, bindparam
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from werkzeug.exceptions import HTTPException
+from utils.error_handler import handle_error
+from utils.helpers import compile_dict_builder
+from utils.serialization import fast_jsonify, fast_dumps
+from services.analytics_tasks import enqueue_daily_analytics
+from utils.cache import (
+    cache_get, cache_set, active_session_key, invalidate_active_session, invalidate_dashboard,
+    invalidate_user_stats
+)
 
 session_bp = Blueprint('sessions', __name__)
 
+_utcnow = datetime.utcnow
+
+# (monotonic expiry, date) for _today(); replaced as a whole so readers never see a torn pair
+_today_cache = (0.0, None)
+
+# Python 3.11+ parses a trailing 'Z' in fromisoformat itself
+_ISO_NATIVE_Z = sys.version_info >= (3, 11)
+
+# Mock sessions for the development endpoints; only start_time varies per call
+_DEV_SESSION_TEMPLATE = MappingProxyType({
+    'id': 999,  # Mock session ID
+    'title': 'Development Study Session',
+    'description': 'Mock session for development',
+    'start_time': None,
+    'end_time': None,
+    'duration': 0,
+    'status': 'active',
+    'is_active': True,
+    'focus_percentage': 0.0,
+    'average_attention_score': 0.0,
+    'blink_rate': 0.0,
+    'posture_score': 0.0,
+    'fatigue_level': 0.0,
+    'break_count': 0,
+    'planned_duration': 25,
+    'eye_tracking_enabled': True,
+    'break_reminders_enabled': True,
+    'posture_monitoring_enabled': True
+})
+_DIRECT_SESSION_TEMPLATE = MappingProxyType({
+    **_DEV_SESSION_TEMPLATE,
+    'id': 1000,  # Mock session ID
+    'title': 'Quick Study Session',
+    'description': 'Auto-created session'
+})
+# Fields the client may override on the direct start endpoint
+_DIRECT_SESSION_FIELDS = (
+    'title', 'description', 'planned_duration',
+    'eye_tracking_enabled', 'break_reminders_enabled', 'posture_monitoring_enabled'
+)
+
+# Built once so every per-session endpoint reuses the same cached compiled statement
+_SESSION_BY_ID = select(StudySession).where(
+    StudySession.id == bindparam('sid'),
+    StudySession.user_id == bindparam('uid')
+)
+
+# Records a break in place and returns the updated row as a StudySession
+_ADD_BREAK_STMT = select(StudySession).from_statement(
+    update(StudySession).where(
+        StudySession.id == bindparam('sid'),
+        StudySession.user_id == bindparam('uid')
+    ).values(
+        break_count=func.coalesce(StudySession.break_count, 0) + 1,
+        total_break_time=func.coalesce(StudySession.total_break_time, 0) + bindparam('duration')
+    ).returning(StudySession)
+)
+
+# Confirms an active-session hint without loading the row
+_IS_ACTIVE_BY_ID = select(StudySession.is_active).where(StudySession.id == bindparam('sid'))
+
+def _fetch_session(session_id, user_id):
+    """Load one of the user's sessions by id, or None"""
+    return db.session.execute(_SESSION_BY_ID, {'sid': session_id, 'uid': user_id}).scalar_one_or_none()
+
+def _active_session_id(user_id):
+    """Id of the user's active session, or 0 if there is none
+    
+    Served from a Redis hint that every state transition drops; a miss falls
+    back to one narrow SELECT and repopulates the hint. A "none" answer is only
+    kept briefly, since its write can land after a concurrent start dropped the hint.
+    """
+    key = active_session_key(user_id)
+    hint = cache_get(key)
+    if hint is not None:
+        return hint
+    
+    row = db.session.query(StudySession.id).filter_by(user_id=user_id, is_active=True).first()
+    active_id = row.id if row else 0
+    ttl_key = 'ACTIVE_SESSION_HINT_TTL' if active_id else 'ACTIVE_SESSION_MISS_TTL'
+    cache_set(key, active_id, current_app.config[ttl_key])
+    return active_id
+
+def _active_conflict_id(user_id):
+    """Id of the active session that blocks a new one (0 if none), dropping the hint if it was stale"""
+    active_id = _active_session_id(user_id)
+    if not active_id:
+        return 0
+    
+    # Confirm the hint with a single-column read; the row is never hydrated
+    if not db.session.execute(_IS_ACTIVE_BY_ID, {'sid': active_id}).scalar():
+        invalidate_active_session(user_id)
+        return 0
+    return active_id
+
+def _active_conflict_response(active_id):
+    """409 response naming the session that blocks a new one"""
+    return jsonify({
+        'error': 'You already have an active session',
+        'active_session_id': active_id
+    }), 409
+
+def _lost_active_race(user_id):
+    """Recover from the one-active-session index rejecting a write"""
+    db.session.rollback()
+    invalidate_active_session(user_id)
+    
+    active_id = _active_conflict_id(user_id)
+    if active_id:
+        return _active_conflict_response(active_id)
+    return jsonify({'error': 'You already have an active session'}), 409
+
+# Columns for session listings, matching the frontend StudySession shape plus title/planned duration
+_LIST_COLS = (
+    StudySession.id,
+    StudySession.title,
+    StudySession.start_time,
+    StudySession.end_time,
+    StudySession.planned_duration,
+    StudySession.actual_duration.label('duration'),
+    StudySession.status,
+    StudySession.is_active,
+    StudySession.focus_percentage,
+    StudySession.average_attention_score,
+    StudySession.blink_rate,
+    StudySession.posture_score,
+    StudySession.fatigue_level,
+    StudySession.break_count
+)
+_list_session_dict = compile_dict_builder(
+    [column.key for column in _LIST_COLS],
+    iso_fields=('start_time', 'end_time')
+)
+
+# Eye tracking sample fields and the defaults applied when a sample omits them
+_TRACKING_FIELDS = (
+    'left_eye_x', 'left_eye_y', 'right_eye_x', 'right_eye_y', 'gaze_x', 'gaze_y',
+    'gaze_direction', 'attention_score', 'is_focused', 'distraction_type', 'is_blinking',
+    'blink_duration', 'head_pitch', 'head_yaw', 'head_roll', 'distance_cm'
+)
+_TRACKING_DEFAULTS = {'attention_score': 0.0, 'is_focused': True, 'is_blinking': False}
+
+# Core insert for tracking samples; skips ORM object construction and flush bookkeeping
+_ETD_INSERT = EyeTrackingData.__table__.insert()
+
+def _tracking_row(session_id, sample):
+    """Build an eye_tracking_data row mapping from a posted sample"""
+    row = {field: sample.get(field, _TRACKING_DEFAULTS.get(field)) for field in _TRACKING_FIELDS}
+    row['session_id'] = session_id
+    return row
+
+def _list_session_rows(filters, limit):
+    """Fetch the listed columns of matching sessions, newest first with id breaking ties"""
+    return db.session.execute(
+        select(*_LIST_COLS).where(*filters).order_by(
+            desc(StudySession.start_time), desc(StudySession.id)
+        ).limit(limit)
+    ).all()
+
+def _stream_session_list(rows, pagination):
+    """Yield the listing JSON row by row, so no full sessions list or body is built"""
+    yield b'{"sessions":['
+    for i, row in enumerate(rows):
+        chunk = fast_dumps(_list_session_dict(row))
+        yield b',' + chunk if i else chunk
+    yield b'],"pagination":' + fast_dumps(pagination) + b'}'
+
+def _count_sessions(filters):
+    """Count the sessions matching the listing filters"""
+    return db.session.execute(
+        select(func.count()).select_from(StudySession).where(*filters)
+    ).scalar()
+
+def _today():
+    """Today's UTC date, recomputed at most once a minute and never across midnight"""
+    global _today_cache
+    expires, today = _today_cache
+    now = time.monotonic()
+    if now >= expires:
+        current = _utcnow()
+        today = current.date()
+        until_midnight = (datetime.combine(today + timedelta(days=1), datetime.min.time()) - current).total_seconds()
+        _today_cache = (now + min(60.0, until_midnight), today)
+    return today
+
+def _parse_iso(value):
+    """Parse an ISO 8601 timestamp, accepting a trailing 'Z' for UTC"""
+    if _ISO_NATIVE_Z or not value.endswith('Z'):
+        return datetime.fromisoformat(value)
+    return datetime.fromisoformat(value[:-1] + '+00:00')
+
+# Body of the common /active 404, encoded once. Each request still gets its own
+# Response, since after-request hooks (CORS) add headers to it
+_NO_ACTIVE_BODY = fast_dumps({'message': 'No active session'})
+
+# 500 message for each view, reported by the blueprint error handler
+_ERROR_MESSAGES = {
+    'start_session_dev': 'Failed to start development session',
+    'start_session_direct': 'Failed to start session',
+    'get_sessions': 'Failed to fetch sessions',
+    'create_session': 'Failed to create session',
+    'get_session': 'Failed to fetch session',
+    'start_session': 'Failed to start session',
+    'pause_session': 'Failed to pause session',
+    'resume_session': 'Failed to resume session',
+    'end_session': 'Failed to end session',
+    'cancel_session': 'Failed to cancel session',
+    'get_active_session': 'Failed to fetch active session',
+    'add_tracking_data': 'Failed to add tracking data',
+    'add_break': 'Failed to add break'
+}
+
+# Failures a session view can raise on its own; HTTP errors, JWT auth failures and
+# StudyEyesError subclass none of these, so the app's handlers still answer them
+_VIEW_ERRORS = (SQLAlchemyError, LookupError, TypeError, ValueError, AttributeError)
+
+def handle_session_error(e):
+    """Turn an unexpected error in a session view into the view's 500 response"""
+    # BadRequestKeyError is both an HTTP error and a KeyError
+    if isinstance(e, HTTPException):
+        return handle_error(e)
+    
+    current_app.logger.exception(f"Unhandled error in {request.endpoint}")
+    db.session.rollback()
+    endpoint = (request.endpoint or '').rpartition('.')[2]
+    return jsonify({
+        'error': _ERROR_MESSAGES.get(endpoint, 'Request failed'),
+        'details': str(e)
+    }), 500
+
+for _exc in _VIEW_ERRORS:
+    session_bp.register_error_handler(_exc, handle_session_error)
+
 @session_bp.route('/start/dev', methods=['POST'])
 def start_session_dev():
     """Create and start a new study session for development (no auth required)"""
-    try:
-        from datetime import datetime
-        
-        # Create mock session data
-        mock_session = {
-            'id': 999,  # Mock session ID
-            'title': 'Development Study Session',
-            'description': 'Mock session for development',
-            'start_time': datetime.utcnow().isoformat(),
-            'end_time': None,
-            'duration': 0,
-            'status': 'active',
-            'is_active': True,
-            'focus_percentage': 0.0,
-            'average_attention_score': 0.0,
-            'blink_rate': 0.0,
-            'posture_score': 0.0,
-            'fatigue_level': 0.0,
-            'break_count': 0,
-            'planned_duration': 25,
-            'eye_tracking_enabled': True,
-            'break_reminders_enabled': True,
-            'posture_monitoring_enabled': True
-        }
-        
-        return jsonify({
-            'message': 'Development session started successfully',
-            'session': mock_session
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': 'Failed to start development session', 'details': str(e)}), 500
+    mock_session = dict(_DEV_SESSION_TEMPLATE)
+    mock_session['start_time'] = datetime.utcnow().isoformat()
+    
+    return jsonify({
+        'message': 'Development session started successfully',
+        'session': mock_session
+    }), 200
 
 @session_bp.route('/start', methods=['POST'])
 def start_session_direct():
     """Create and start a new study session directly (for compatibility)"""
-    try:
-        # For development, return mock data without authentication
-        data = request.get_json() or {}
-        
-        from datetime import datetime
-        
-        mock_session = {
-            'id': 1000,  # Mock session ID
-            'title': data.get('title', 'Quick Study Session'),
-            'description': data.get('description', 'Auto-created session'),
-            'start_time': datetime.utcnow().isoformat(),
-            'end_time': None,
-            'duration': 0,
-            'status': 'active',
-            'is_active': True,
-            'focus_percentage': 0.0,
-            'average_attention_score': 0.0,
-            'blink_rate': 0.0,
-            'posture_score': 0.0,
-            'fatigue_level': 0.0,
-            'break_count': 0,
-            'planned_duration': data.get('planned_duration', 25),
-            'eye_tracking_enabled': data.get('eye_tracking_enabled', True),
-            'break_reminders_enabled': data.get('break_reminders_enabled', True),
-            'posture_monitoring_enabled': data.get('posture_monitoring_enabled', True)
-        }
-        
-        return jsonify(mock_session), 200
-        
-    except Exception as e:
-        return jsonify({'error': 'Failed to start session', 'details': str(e)}), 500
+    # For development, return mock data without authentication
+    data = request.get_json() or {}
+    
+    mock_session = dict(_DIRECT_SESSION_TEMPLATE)
+    mock_session.update((key, data[key]) for key in _DIRECT_SESSION_FIELDS if key in data)
+    mock_session['start_time'] = datetime.utcnow().isoformat()
+    
+    return jsonify(mock_session), 200
 
 @session_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_sessions():
     """Get user's study sessions with pagination and filtering"""
-    try:
-        user_id = get_jwt_identity()
-        
-        # Query parameters
-        page = request.args.get('page', 1, type=int)
-        per_page = min(request.args.get('per_page', 10, type=int), 100)  # Max 100 per page
-        status = request.args.get('status')  # active, completed, cancelled
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        
-        # Build query
-        query = StudySession.query.filter_by(user_id=user_id)
-        
-        # Apply filters
-        if status:
-            query = query.filter(StudySession.status == status)
-        
-        if date_from:
-            try:
-                from_date = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-                query = query.filter(StudySession.start_time >= from_date)
-            except ValueError:
-                return jsonify({'error': 'Invalid date_from format'}), 400
-        
-        if date_to:
-            try:
-                to_date = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-                query = query.filter(StudySession.start_time <= to_date)
-            except ValueError:
-                return jsonify({'error': 'Invalid date_to format'}), 400
-        
-        # Order by start time (newest first)
-        query = query.order_by(desc(StudySession.start_time))
-        
-        # Paginate
-        pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
-        
-        sessions = [session.to_dict() for session in pagination.items]
-        
-        return jsonify({
-            'sessions': sessions,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': 'Failed to fetch sessions', 'details': str(e)}), 500
+    user_id = get_jwt_identity()
+    
+    # Query parameters
+    before = request.args.get('before')  # Cursor: "<start_time ISO>,<id>" of the last row seen
+    per_page = max(min(request.args.get('per_page', 10, type=int), 100), 1)  # 1 to 100 per page
+    status = request.args.get('status')  # active, completed, cancelled
+    date_from = request.args.get('date_from')
+    date_to = request.args.get('date_to')
+    
+    # Collect filters; the row and count queries both build from them
+    filters = [StudySession.user_id == user_id]
+    
+    # Apply filters
+    if status:
+        filters.append(StudySession.status == status)
+    
+    if date_from:
+        try:
+            from_date = _parse_iso(date_from)
+            filters.append(StudySession.start_time >= from_date)
+        except ValueError:
+            return jsonify({'error': 'Invalid date_from format'}), 400
+    
+    if date_to:
+        try:
+            to_date = _parse_iso(date_to)
+            filters.append(StudySession.start_time <= to_date)
+        except ValueError:
+            return jsonify({'error': 'Invalid date_to format'}), 400
+    
+    if before:
+        # Keyset pagination: continue strictly after the cursor row.
+        # Later pages skip the COUNT, so there is only the one query
+        try:
+            before_time, _, before_id = before.rpartition(',')
+            cursor = tuple_(StudySession.start_time, StudySession.id) < (_parse_iso(before_time), int(before_id))
+        except ValueError:
+            return jsonify({'error': 'Invalid before cursor'}), 400
+        
+        rows = _list_session_rows(filters + [cursor], per_page + 1)
+        total = None
+    else:
+        # First page also reports the total
+        rows = _list_session_rows(filters, per_page + 1)
+        total = _count_sessions(filters)
+    
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    
+    next_cursor = f"{rows[-1].start_time.isoformat()},{rows[-1].id}" if has_next else None
+    pagination = {
+        'per_page': per_page,
+        'total': total,
+        'has_next': has_next,
+        'next_cursor': next_cursor
+    }
+    
+    return Response(
+        stream_with_context(_stream_session_list(rows, pagination)),
+        mimetype='application/json'
+    )
 
 @session_bp.route('/', methods=['POST'])
 @jwt_required()
 def create_session():
     """Create a new study session"""
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    
+    # Validate required fields
+    if 'title' not in data:
+        return jsonify({'error': 'Session title is required'}), 400
+    
+    title = data['title'].strip()
+    if not title:
+        return jsonify({'error': 'Session title cannot be empty'}), 400
+    
+    # Check if user has an active session
+    active_id = _active_conflict_id(user_id)
+    if active_id:
+        return _active_conflict_response(active_id)
+    
+    # Create new session
+    session = StudySession(
+        user_id=user_id,
+        title=title,
+        description=data.get('description'),
+        planned_duration=data.get('planned_duration', 25)
+    )
+    
+    # Set session preferences
+    session.eye_tracking_enabled = data.get('eye_tracking_enabled', True)
+    session.break_reminders_enabled = data.get('break_reminders_enabled', True)
+    session.posture_monitoring_enabled = data.get('posture_monitoring_enabled', True)
+    
+    db.session.add(session)
     try:
-        user_id = get_jwt_identity()
-        data = request.get_json()
-        
-        # Validate required fields
-        if 'title' not in data:
-            return jsonify({'error': 'Session title is required'}), 400
-        
-        title = data['title'].strip()
-        if not title:
-            return jsonify({'error': 'Session title cannot be empty'}), 400
-        
-        # Check if user has an active session
-        active_session = StudySession.query.filter_by(
-            user_id=user_id, 
-            is_active=True
-        ).first()
-        
-        if active_session:
-            return jsonify({
-                'error': 'You already have an active session',
-                'active_session': active_session.to_dict()
-            }), 409
-        
-        # Create new session
-        session = StudySession(
-            user_id=user_id,
-            title=title,
-            description=data.get('description'),
-            planned_duration=data.get('planned_duration', 25)
-        )
-        
-        # Set session preferences
-        session.eye_tracking_enabled = data.get('eye_tracking_enabled', True)
-        session.break_reminders_enabled = data.get('break_reminders_enabled', True)
-        session.posture_monitoring_enabled = data.get('posture_monitoring_enabled', True)
-        
-        db.session.add(session)
         db.session.commit()
-        
-        return jsonify({
-            'message': 'Session created successfully',
-            'session': session.to_dict()
-        }), 201
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'Failed to create session', 'details': str(e)}), 500
+    except IntegrityError:
+        # Lost a race with a concurrent start; the partial unique index caught it
+        return _lost_active_race(user_id)
+    invalidate_active_session(user_id)
+    invalidate_dashboard(user_id)
+    invalidate_user_stats(user_id)
+    
+    return jsonify({
+        'message': 'Session created successfully',
+        'session': session.to_dict()
+    }), 201
 
 @session_bp.route('/<int:session_id>', methods=['GET'])
 @jwt_required()
 def get_session(session_id):
     """Get specific session details"""
-    try:
-        user_id = get_jwt_identity()
-        
-        session = StudySession.query.filter_by(
-            id=session_id, 
-            user_id=user_id
-        ).first()
-        
-        if not session:
-            return jsonify({'error': 'Session not found'}), 404
-        
-        return jsonify({
-            'session': session.to_dict()
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': 'Failed to fetch session', 'details': str(e)}), 500
+    user_id = get_jwt_identity()
+    
+    session = _fetch_session(session_id, user_id)
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    return fast_jsonify({
+        'session': session.to_dict()
+    })
 
 @session_bp.route('/<int:session_id>/start', methods=['POST'])
 @jwt_required()
 def start_session(session_id):
     """Start a study session"""
+    user_id = get_jwt_identity()
+    
+    session = _fetch_session(session_id, user_id)
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    if session.is_active:
+        return jsonify({'error': 'Session is already active'}), 409
+    
+    # Check if user has another active session
+    active_id = _active_conflict_id(user_id)
+    if active_id:
+        return _active_conflict_response(active_id)
+    
+    # Start the session
     try:
-        user_id = get_jwt_identity()
-        
-        session = StudySession.query.filter_by(
-            id=session_id, 
-            user_id=user_id
-        ).first()
-        
-        if not session:
-            return jsonify({'error': 'Session not found'}), 404
-        
-        if session.is_active:
-            return jsonify({'error': 'Session is already active'}), 409
-        
-        # Check if user has another active session
-        active_session = StudySession.query.filter_by(
-            user_id=user_id, 
-            is_active=True
-        ).first()
-        
-        if active_session:
-            return jsonify({
-                'error': 'You already have an active session',
-                'active_session': active_session.to_dict()
-            }), 409
-        
-        # Start the session
         session.start_session()
-        
-        return jsonify({
-            'message': 'Session started successfully',
-            'session': session.to_dict()
-        }), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'Failed to start session', 'details': str(e)}), 500
+    except IntegrityError:
+        return _lost_active_race(user_id)
+    invalidate_dashboard(user_id)
+    cache_set(active_session_key(user_id), session.id, (session.planned_duration or 25) * 60 * 2)
+    
+    return jsonify({
+        'message': 'Session started successfully',
+        'session': session.to_dict()
+    }), 200
 
 @session_bp.route('/<int:session_id>/pause', methods=['POST'])
 @jwt_required()
 def pause_session(session_id):
     """Pause a study session"""
-    try:
-        user_id = get_jwt_identity()
-        
-        session = StudySession.query.filter_by(
-            id=session_id, 
-            user_id=user_id
-        ).first()
-        
-        if not session:
-            return jsonify({'error': 'Session not found'}), 404
-        
-        if not session.is_active:
-            return jsonify({'error': 'Session is not active'}), 409
-        
-        session.pause_session()
-        
-        return jsonify({
-            'message': 'Session paused successfully',
-            'session': session.to_dict()
-        }), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'Failed to pause session', 'details': str(e)}), 500
+    user_id = get_jwt_identity()
+    
+    session = _fetch_session(session_id, user_id)
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    if not session.is_active:
+        return jsonify({'error': 'Session is not active'}), 409
+    
+    session.pause_session()
+    invalidate_dashboard(user_id)
+    invalidate_active_session(user_id)
+    
+    return jsonify({
+        'message': 'Session paused successfully',
+        'session': session.to_dict()
+    }), 200
 
 @session_bp.route('/<int:session_id>/resume', methods=['POST'])
 @jwt_required()
 def resume_session(session_id):
     """Resume a paused study session"""
-    try:
-        user_id = get_jwt_identity()
-        
-        session = StudySession.query.filter_by(
-            id=session_id, 
-            user_id=user_id
-        ).first()
-        
-        if not session:
-            return jsonify({'error': 'Session not found'}), 404
-        
-        if session.status != 'paused':
-            return jsonify({'error': 'Session is not paused'}), 409
-        
-        session.resume_session()
-        
-        return jsonify({
-            'message': 'Session resumed successfully',
-            'session': session.to_dict()
-        }), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'Failed to resume session', 'details': str(e)}), 500
+    user_id = get_jwt_identity()
+    
+    session = _fetch_session(session_id, user_id)
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    if session.status != 'paused':
+        return jsonify({'error': 'Session is not paused'}), 409
+    
+    session.resume_session()
+    invalidate_dashboard(user_id)
+    invalidate_active_session(user_id)
+    
+    return jsonify({
+        'message': 'Session resumed successfully',
+        'session': session.to_dict()
+    }), 200
 
 @session_bp.route('/<int:session_id>/end', methods=['POST'])
 @jwt_required()
 def end_session(session_id):
     """End a study session"""
-    try:
-        user_id = get_jwt_identity()
-        
-        session = StudySession.query.filter_by(
-            id=session_id, 
-            user_id=user_id
-        ).first()
-        
-        if not session:
-            return jsonify({'error': 'Session not found'}), 404
-        
-        if not session.is_active:
-            return jsonify({'error': 'Session is not active'}), 409
-        
-        session.end_session()
-        
-        # Update user analytics for today
-        today = datetime.utcnow().date()
-        analytics = UserAnalytics.query.filter_by(
-            user_id=user_id, 
-            date=today
-        ).first()
-        
-        if not analytics:
-            analytics = UserAnalytics(user_id=user_id, date=today)
-            db.session.add(analytics)
-        
-        analytics.calculate_daily_metrics()
-        
-        return jsonify({
-            'message': 'Session ended successfully',
-            'session': session.to_dict()
-        }), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'Failed to end session', 'details': str(e)}), 500
+    user_id = get_jwt_identity()
+    
+    session = _fetch_session(session_id, user_id)
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    if not session.is_active:
+        return jsonify({'error': 'Session is not active'}), 409
+    
+    session.end_session()
+    db.session.commit()
+    
+    # Roll up today's analytics in the background
+    enqueue_daily_analytics(user_id, _today())
+    invalidate_dashboard(user_id)
+    invalidate_active_session(user_id)
+    invalidate_user_stats(user_id)
+    
+    return jsonify({
+        'message': 'Session ended successfully',
+        'session': session.to_dict()
+    }), 200
 
 @session_bp.route('/<int:session_id>/cancel', methods=['POST'])
 @jwt_required()
 def cancel_session(session_id):
     """Cancel a study session"""
-    try:
-        user_id = get_jwt_identity()
-        
-        session = StudySession.query.filter_by(
-            id=session_id, 
-            user_id=user_id
-        ).first()
-        
-        if not session:
-            return jsonify({'error': 'Session not found'}), 404
-        
-        if not session.is_active:
-            return jsonify({'error': 'Session is not active'}), 409
-        
-        session.cancel_session()
-        
-        return jsonify({
-            'message': 'Session cancelled successfully',
-            'session': session.to_dict()
-        }), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'Failed to cancel session', 'details': str(e)}), 500
+    user_id = get_jwt_identity()
+    
+    session = _fetch_session(session_id, user_id)
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    if not session.is_active:
+        return jsonify({'error': 'Session is not active'}), 409
+    
+    session.cancel_session()
+    invalidate_dashboard(user_id)
+    invalidate_active_session(user_id)
+    invalidate_user_stats(user_id)
+    
+    return jsonify({
+        'message': 'Session cancelled successfully',
+        'session': session.to_dict()
+    }), 200
 
 @session_bp.route('/active', methods=['GET'])
 @jwt_required()
 def get_active_session():
     """Get user's current active session"""
-    try:
-        user_id = get_jwt_identity()
-        
-        session = StudySession.query.filter_by(
-            user_id=user_id, 
-            is_active=True
-        ).first()
-        
-        if not session:
-            return jsonify({'message': 'No active session'}), 404
-        
-        return jsonify({
-            'session': session.to_dict()
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': 'Failed to fetch active session', 'details': str(e)}), 500
+    user_id = get_jwt_identity()
+    
+    # A cached "no active session" answers the common polling case without the DB
+    active_id = _active_session_id(user_id)
+    session = _fetch_session(active_id, user_id) if active_id else None
+    
+    if active_id and (not session or not session.is_active):
+        # Stale hint: drop it and ask the database again
+        invalidate_active_session(user_id)
+        active_id = _active_session_id(user_id)
+        session = _fetch_session(active_id, user_id) if active_id else None
+    
+    if not session or not session.is_active:
+        return Response(_NO_ACTIVE_BODY, status=404, mimetype='application/json')
+    
+    return fast_jsonify({
+        'session': session.to_dict()
+    })
 
 @session_bp.route('/<int:session_id>/tracking', methods=['POST'])
 @jwt_required()
 def add_tracking_data(session_id):
     """Add eye tracking data to a session"""
-    try:
-        user_id = get_jwt_identity()
-        
-        session = StudySession.query.filter_by(
-            id=session_id, 
-            user_id=user_id
-        ).first()
-        
-        if not session:
-            return jsonify({'error': 'Session not found'}), 404
-        
-        if not session.is_active:
-            return jsonify({'error': 'Session is not active'}), 409
-        
-        data = request.get_json()
-        
-        # Create tracking data entry
-        tracking_data = EyeTrackingData(
-            session_id=session_id,
-            left_eye_x=data.get('left_eye_x'),
-            left_eye_y=data.get('left_eye_y'),
-            right_eye_x=data.get('right_eye_x'),
-            right_eye_y=data.get('right_eye_y'),
-            gaze_x=data.get('gaze_x'),
-            gaze_y=data.get('gaze_y'),
-            gaze_direction=data.get('gaze_direction'),
-            attention_score=data.get('attention_score', 0.0),
-            is_focused=data.get('is_focused', True),
-            distraction_type=data.get('distraction_type'),
-            is_blinking=data.get('is_blinking', False),
-            blink_duration=data.get('blink_duration'),
-            head_pitch=data.get('head_pitch'),
-            head_yaw=data.get('head_yaw'),
-            head_roll=data.get('head_roll'),
-            distance_cm=data.get('distance_cm')
+    user_id = get_jwt_identity()
+    
+    session = _fetch_session(session_id, user_id)
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    if not session.is_active:
+        return jsonify({'error': 'Session is not active'}), 409
+    
+    data = request.get_json()
+    
+    # Accept a batch of samples ({"samples": [...]}) or a single sample
+    samples = data['samples'] if 'samples' in data else [data]
+    
+    # Insert the whole batch in one statement and one commit
+    rows = [_tracking_row(session_id, sample) for sample in samples]
+    if rows:
+        db.session.execute(_ETD_INSERT, rows)
+    
+    # Update session metrics once for the batch
+    timed = [s for s in samples if 'focus_time' in s and 'distraction_time' in s]
+    if timed:
+        session.update_focus_metrics(
+            sum(s['focus_time'] for s in timed),
+            sum(s['distraction_time'] for s in timed),
+            sum(s.get('attention_score', 0.0) for s in timed) / len(timed)
         )
-        
-        db.session.add(tracking_data)
-        
-        # Update session metrics
-        if 'focus_time' in data and 'distraction_time' in data:
-            session.update_focus_metrics(
-                data['focus_time'],
-                data['distraction_time'],
-                data.get('attention_score', 0.0)
-            )
-        
-        db.session.commit()
-        
-        return jsonify({
-            'message': 'Tracking data added successfully'
-        }), 201
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': 'Failed to add tracking data', 'details': str(e)}), 500
+    
+    db.session.commit()
+    
+    return fast_jsonify({
+        'message': 'Tracking data added successfully',
+        'samples': len(rows)
+    }, status=201)
 
 @session_bp.route('/<int:session_id>/break', methods=['POST'])
 @jwt_required()
 def add_break(session_id):
     """Add a break to the session"""
-    try:
-        user_id = get_jwt_identity()
-        
-        session = StudySession.query.filter_by(
-            id=session_id, 
-            user_id=user_id
-        ).first()
-        
-        if not session:
-            return jsonify({'error': 'Session not found'}), 404
-        
-        data = request.get_json()
-        break_duration = data.get('duration', 300)  # Default 5 minutes in seconds
-        
-        session.add_break(break_duration)
-        
-        return jsonify({
-            'message': 'Break added successfully',
-            'session': session.to_dict()
-        }), 200
-        
-    except Exception as e:
+    user_id = get_jwt_identity()
+    
+    data = request.get_json()
+    break_duration = data.get('duration', 300)  # Default 5 minutes in seconds
+    
+    # Ownership check and counter update in one statement; no row means no such session
+    session = db.session.execute(
+        _ADD_BREAK_STMT, {'sid': session_id, 'uid': user_id, 'duration': break_duration}
+    ).scalar_one_or_none()
+    
+    if not session:
         db.session.rollback()
-        return jsonify({'error': 'Failed to add break', 'details': str(e)}), 500
+        return jsonify({'error': 'Session not found'}), 404
+    
+    db.session.commit()
+    invalidate_dashboard(user_id)
+    
+    return jsonify({
+        'message': 'Break added successfully',
+        'session': session.to_dict()
+    }), 200
@@ -2,62 +2,141 @@
 User routes for user management and profile operations
 """
 
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from models.database import db
 from models.user import User
-from models.session import StudySession
+from models.session import StudySession, EyeTrackingData
 from models.analytics import UserAnalytics
+from utils.helpers import run_blocking
+from utils.cache import (
+    cache_get, cache_set, invalidate_user, invalidate_active_session, invalidate_user_stats,
+    profile_stats_key, stats_summary_key, revoke_token
+)
 from datetime import datetime, timedelta
+import time
+from sqlalchemy import select, delete, bindparam, func, case, and_, desc, Date
 
 user_bp = Blueprint('users', __name__)
 
+# Calendar day of a session's start; typed so SQLite's string result comes back as a date
+_SESSION_DAY = func.date(StudySession.start_time, type_=Date)
+
+# Days of analytics fetched per streak query; most streaks fit in one window
+_STREAK_WINDOW_DAYS = 90
+
+# Longest streak reported; bounds the scan for users with years of daily activity
+_MAX_STREAK_DAYS = 365
+
+# One window of daily session counts, newest first; compiled once and re-bound per query
+_STREAK_WINDOW = select(UserAnalytics.date, UserAnalytics.total_sessions).where(
+    UserAnalytics.user_id == bindparam('uid'),
+    UserAnalytics.date <= bindparam('end'),
+    UserAnalytics.date > bindparam('start')
+).order_by(UserAnalytics.date.desc())
+
+def _compute_streak(user_id, today, max_days=_MAX_STREAK_DAYS):
+    """Count consecutive days with sessions, ending today, up to max_days
+    
+    Reads the analytics rows a window at a time instead of one query per day;
+    only a streak that fills the whole window needs another query.
+    """
+    streak = 0
+    check_date = today
+    
+    while streak < max_days:
+        window = min(_STREAK_WINDOW_DAYS, max_days - streak)
+        rows = db.session.execute(_STREAK_WINDOW, {
+            'uid': user_id,
+            'end': check_date,
+            'start': check_date - timedelta(days=window)
+        }).all()
+        
+        for row in rows:
+            if row.date != check_date or not row.total_sessions:
+                return streak
+            streak += 1
+            check_date -= timedelta(days=1)
+        
+        if len(rows) < window:
+            return streak
+    
+    return streak
+
+# Achievement rules as (statistic, minimum, name), in the order they are listed
+_ACHIEVEMENTS = (
+    ('total_sessions', 1, 'First Study Session'),
+    ('total_sessions', 10, 'Study Warrior'),
+    ('total_sessions', 50, 'Dedicated Learner'),
+    ('total_sessions', 100, 'Study Master'),
+    ('total_study_time', 60, 'Hour of Power'),  # 1 hour
+    ('total_study_time', 600, 'Study Marathon'),  # 10 hours
+    ('total_study_time', 3000, 'Learning Legend'),  # 50 hours
+    ('current_streak', 3, 'Consistency Champion'),
+    ('current_streak', 7, 'Week Warrior'),
+    ('current_streak', 30, 'Monthly Master'),
+    ('avg_focus', 80, 'Focus Expert'),
+    ('avg_focus', 90, 'Concentration King')
+)
+
+def _earned_achievements(stats):
+    """Names of the achievements whose thresholds the given statistics meet"""
+    return [name for field, minimum, name in _ACHIEVEMENTS if stats[field] >= minimum]
+
+# Preferences a user may update, and the allowed range for the numeric ones
+_PREFERENCE_FIELDS = (
+    'default_session_duration', 'break_duration', 'focus_threshold', 'timezone', 'notification_enabled'
+)
+_PREFERENCE_RANGES = {
+    'default_session_duration': (5, 480, 'Session duration must be between 5 and 480 minutes'),  # 5 minutes to 8 hours
+    'break_duration': (1, 60, 'Break duration must be between 1 and 60 minutes'),  # 1 to 60 minutes
+    'focus_threshold': (0.1, 1.0, 'Focus threshold must be between 0.1 and 1.0')
+}
+
+def _conditional_json(payload):
+    """JSON response with an ETag of its body; a matching If-None-Match gets an empty 304"""
+    response = jsonify(payload)
+    response.add_etag()
+    return response.make_conditional(request)
+
 @user_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_user_profile():
     """Get detailed user profile with statistics"""
     try:
         user_id = get_jwt_identity()
+        
+        # Repeat polls are served from the cache until a session or profile change drops it
+        cache_key = profile_stats_key(user_id)
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return _conditional_json({'user': cached})
+        
         user = User.query.get(user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get user statistics
-        total_sessions = StudySession.query.filter_by(user_id=user_id).count()
-        completed_sessions = StudySession.query.filter_by(
-            user_id=user_id, 
-            status='completed'
-        ).count()
-        
-        # Get total study time (all time)
-        sessions = StudySession.query.filter_by(user_id=user_id).all()
-        total_study_minutes = sum([s.actual_duration or 0 for s in sessions])
+        # Get user statistics and total study time (all time) in one aggregate
+        total_sessions, completed_sessions, total_study_minutes = db.session.execute(select(
+            func.count(StudySession.id),
+            func.count(case((StudySession.status == 'completed', 1))),
+            func.coalesce(func.sum(StudySession.actual_duration), 0)
+        ).where(StudySession.user_id == user_id)).one()
         
         # Get recent analytics
-        recent_analytics = UserAnalytics.query.filter_by(
-            user_id=user_id
-        ).order_by(UserAnalytics.date.desc()).limit(7).all()
+        recent_focus = db.session.execute(
+            select(UserAnalytics.average_focus_percentage).where(
+                UserAnalytics.user_id == user_id
+            ).order_by(UserAnalytics.date.desc()).limit(7)
+        ).scalars().all()
         
         avg_focus = 0
-        if recent_analytics:
-            avg_focus = sum([a.average_focus_percentage for a in recent_analytics]) / len(recent_analytics)
+        if recent_focus:
+            avg_focus = sum(recent_focus) / len(recent_focus)
         
         # Calculate streak (consecutive days with sessions)
-        current_streak = 0
-        check_date = datetime.utcnow().date()
-        
-        while True:
-            day_analytics = UserAnalytics.query.filter_by(
-                user_id=user_id,
-                date=check_date
-            ).first()
-            
-            if day_analytics and day_analytics.total_sessions > 0:
-                current_streak += 1
-                check_date -= timedelta(days=1)
-            else:
-                break
+        current_streak = _compute_streak(user_id, datetime.utcnow().date())
         
         profile_data = user.to_dict()
         profile_data.update({
@@ -72,7 +151,9 @@ def get_user_profile():
             }
         })
         
-        return jsonify({'user': profile_data}), 200
+        cache_set(cache_key, profile_data, current_app.config['USER_STATS_CACHE_TTL'])
+        
+        return _conditional_json({'user': profile_data})
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch user profile', 'details': str(e)}), 500
@@ -90,35 +171,19 @@ def update_preferences():
         
         data = request.get_json()
         
+        # Validate everything before touching the user
+        for field, (low, high, message) in _PREFERENCE_RANGES.items():
+            if field in data and not low <= data[field] <= high:
+                return jsonify({'error': message}), 400
+        
         # Update preferences
-        if 'default_session_duration' in data:
-            duration = data['default_session_duration']
-            if 5 <= duration <= 480:  # 5 minutes to 8 hours
-                user.default_session_duration = duration
-            else:
-                return jsonify({'error': 'Session duration must be between 5 and 480 minutes'}), 400
-        
-        if 'break_duration' in data:
-            duration = data['break_duration']
-            if 1 <= duration <= 60:  # 1 to 60 minutes
-                user.break_duration = duration
-            else:
-                return jsonify({'error': 'Break duration must be between 1 and 60 minutes'}), 400
-        
-        if 'focus_threshold' in data:
-            threshold = data['focus_threshold']
-            if 0.1 <= threshold <= 1.0:
-                user.focus_threshold = threshold
-            else:
-                return jsonify({'error': 'Focus threshold must be between 0.1 and 1.0'}), 400
-        
-        if 'timezone' in data:
-            user.timezone = data['timezone']
-        
-        if 'notification_enabled' in data:
-            user.notification_enabled = data['notification_enabled']
+        for field in _PREFERENCE_FIELDS:
+            if field in data:
+                setattr(user, field, data[field])
         
         db.session.commit()
+        invalidate_user(user_id)
+        invalidate_user_stats(user_id)
         
         return jsonify({
             'message': 'Preferences updated successfully',
@@ -135,9 +200,9 @@ def get_user_goals():
     """Get user goals and targets"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         
-        if not user:
+        # Only existence matters here; the user's columns are never read
+        if db.session.execute(select(User.id).where(User.id == user_id)).scalar() is None:
             return jsonify({'error': 'User not found'}), 404
         
         # Default goals (could be stored in user profile or separate table)
@@ -151,41 +216,37 @@ def get_user_goals():
         
         # Get current progress
         today = datetime.utcnow().date()
-        today_analytics = UserAnalytics.query.filter_by(
-            user_id=user_id,
-            date=today
-        ).first()
-        
         week_start = today - timedelta(days=today.weekday())
-        week_analytics = UserAnalytics.get_weekly_analytics(user_id, week_start)
-        
-        current_month = datetime.utcnow().month
-        current_year = datetime.utcnow().year
-        month_analytics = UserAnalytics.get_monthly_analytics(user_id, current_year, current_month)
+        week_end = week_start + timedelta(days=7)
+        month_start = today.replace(day=1)
+        next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+        
+        in_today = UserAnalytics.date == today
+        in_week = and_(UserAnalytics.date >= week_start, UserAnalytics.date < week_end)
+        in_month = and_(UserAnalytics.date >= month_start, UserAnalytics.date < next_month_start)
+        
+        # Today, this week and this month from one scan over the days they span
+        current = db.session.execute(select(
+            func.max(case((in_today, UserAnalytics.total_study_time))).label('today_study_time'),
+            func.max(case((in_today, UserAnalytics.average_focus_percentage))).label('today_focus'),
+            func.coalesce(func.sum(case((in_week, UserAnalytics.total_sessions))), 0).label('weekly_sessions'),
+            func.coalesce(func.sum(case((in_month, UserAnalytics.total_study_time))), 0).label('monthly_study_time')
+        ).where(
+            UserAnalytics.user_id == user_id,
+            UserAnalytics.date >= min(week_start, month_start),
+            UserAnalytics.date < max(week_end, next_month_start)
+        )).one()
         
         progress = {
-            'daily_study_minutes': today_analytics.total_study_time if today_analytics else 0,
-            'weekly_sessions': sum([a['total_sessions'] for a in week_analytics]),
-            'current_focus_percentage': today_analytics.average_focus_percentage if today_analytics else 0,
+            'daily_study_minutes': current.today_study_time or 0,
+            'weekly_sessions': current.weekly_sessions,
+            'current_focus_percentage': current.today_focus or 0,
             'current_streak': 0,  # Calculate streak
-            'monthly_hours': sum([a['total_study_time'] for a in month_analytics]) / 60
+            'monthly_hours': current.monthly_study_time / 60
         }
         
         # Calculate current streak
-        current_streak = 0
-        check_date = today
-        
-        while True:
-            day_analytics = UserAnalytics.query.filter_by(
-                user_id=user_id,
-                date=check_date
-            ).first()
-            
-            if day_analytics and day_analytics.total_sessions > 0:
-                current_streak += 1
-                check_date -= timedelta(days=1)
-            else:
-                break
+        current_streak = _compute_streak(user_id, today)
         
         progress['current_streak'] = current_streak
         
@@ -204,68 +265,60 @@ def get_stats_summary():
     try:
         user_id = get_jwt_identity()
         
-        # Get all-time statistics
-        all_sessions = StudySession.query.filter_by(user_id=user_id).all()
-        
-        # Basic counts
-        total_sessions = len(all_sessions)
-        completed_sessions = len([s for s in all_sessions if s.status == 'completed'])
-        total_study_time = sum([s.actual_duration or 0 for s in all_sessions])
-        
-        # Focus and productivity averages
-        completed_with_focus = [s for s in all_sessions if s.status == 'completed' and s.focus_percentage > 0]
-        avg_focus = sum([s.focus_percentage for s in completed_with_focus]) / len(completed_with_focus) if completed_with_focus else 0
+        cache_key = stats_summary_key(user_id)
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return _conditional_json(cached)
         
         # Time-based statistics
-        now = datetime.utcnow()
-        this_week_start = now.date() - timedelta(days=now.weekday())
-        this_month_start = now.date().replace(day=1)
-        
-        this_week_sessions = [s for s in all_sessions if s.start_time and s.start_time.date() >= this_week_start]
-        this_month_sessions = [s for s in all_sessions if s.start_time and s.start_time.date() >= this_month_start]
-        
-        # Best day analysis
-        daily_stats = {}
-        for session in all_sessions:
-            if session.start_time:
-                date = session.start_time.date()
-                if date not in daily_stats:
-                    daily_stats[date] = {'sessions': 0, 'study_time': 0, 'focus_sum': 0, 'focus_count': 0}
-                
-                daily_stats[date]['sessions'] += 1
-                daily_stats[date]['study_time'] += session.actual_duration or 0
-                
-                if session.focus_percentage > 0:
-                    daily_stats[date]['focus_sum'] += session.focus_percentage
-                    daily_stats[date]['focus_count'] += 1
+        today = datetime.utcnow().date()
+        this_week_start = datetime.combine(today - timedelta(days=today.weekday()), datetime.min.time())
+        this_month_start = datetime.combine(today.replace(day=1), datetime.min.time())
+        duration = func.coalesce(StudySession.actual_duration, 0)
+        
+        # All-time, this-week and this-month totals in one aggregate
+        totals = db.session.execute(select(
+            func.count(StudySession.id).label('total_sessions'),
+            func.count(case((StudySession.status == 'completed', 1))).label('completed_sessions'),
+            func.coalesce(func.sum(duration), 0).label('total_study_time'),
+            # Focus average over completed sessions that recorded focus
+            func.avg(case((
+                and_(StudySession.status == 'completed', StudySession.focus_percentage > 0),
+                StudySession.focus_percentage
+            ))).label('avg_focus'),
+            func.count(case((StudySession.start_time >= this_week_start, 1))).label('week_sessions'),
+            func.coalesce(func.sum(case((StudySession.start_time >= this_week_start, duration))), 0).label('week_study_time'),
+            func.count(case((StudySession.start_time >= this_month_start, 1))).label('month_sessions'),
+            func.coalesce(func.sum(case((StudySession.start_time >= this_month_start, duration))), 0).label('month_study_time')
+        ).where(StudySession.user_id == user_id)).one()
+        
+        total_sessions = totals.total_sessions
+        completed_sessions = totals.completed_sessions
+        total_study_time = totals.total_study_time
+        avg_focus = totals.avg_focus or 0
+        
+        # Best day analysis: the day with the most study time, if any
+        best = db.session.execute(select(
+            _SESSION_DAY.label('day'),
+            func.count(StudySession.id).label('sessions'),
+            func.sum(duration).label('study_time'),
+            func.avg(case((StudySession.focus_percentage > 0, StudySession.focus_percentage))).label('average_focus')
+        ).where(
+            StudySession.user_id == user_id,
+            StudySession.start_time.isnot(None)
+        ).group_by(_SESSION_DAY).having(func.sum(duration) > 0).order_by(desc('study_time')).limit(1)).first()
         
         best_day = None
-        max_study_time = 0
-        for date, stats in daily_stats.items():
-            if stats['study_time'] > max_study_time:
-                max_study_time = stats['study_time']
-                best_day = {
-                    'date': date.isoformat(),
-                    'study_time_minutes': stats['study_time'],
-                    'sessions': stats['sessions'],
-                    'average_focus': stats['focus_sum'] / stats['focus_count'] if stats['focus_count'] > 0 else 0
-                }
+        if best:
+            best_day = {
+                'date': best.day.isoformat(),
+                'study_time_minutes': best.study_time,
+                'sessions': best.sessions,
+                'average_focus': best.average_focus or 0
+            }
         
         # Calculate current streak
-        current_streak = 0
-        check_date = now.date()
-        
-        while True:
-            day_analytics = UserAnalytics.query.filter_by(
-                user_id=user_id,
-                date=check_date
-            ).first()
-            
-            if day_analytics and day_analytics.total_sessions > 0:
-                current_streak += 1
-                check_date -= timedelta(days=1)
-            else:
-                break
+        current_streak = _compute_streak(user_id, today)
         
         summary = {
             'all_time': {
@@ -276,12 +329,12 @@ def get_stats_summary():
                 'average_focus_percentage': round(avg_focus, 2)
             },
             'this_week': {
-                'sessions': len(this_week_sessions),
-                'study_hours': round(sum([s.actual_duration or 0 for s in this_week_sessions]) / 60, 1)
+                'sessions': totals.week_sessions,
+                'study_hours': round(totals.week_study_time / 60, 1)
             },
             'this_month': {
-                'sessions': len(this_month_sessions),
-                'study_hours': round(sum([s.actual_duration or 0 for s in this_month_sessions]) / 60, 1)
+                'sessions': totals.month_sessions,
+                'study_hours': round(totals.month_study_time / 60, 1)
             },
             'streaks': {
                 'current_streak_days': current_streak
@@ -291,35 +344,16 @@ def get_stats_summary():
         }
         
         # Add achievements
-        if total_sessions >= 1:
-            summary['achievements'].append('First Study Session')
-        if total_sessions >= 10:
-            summary['achievements'].append('Study Warrior')
-        if total_sessions >= 50:
-            summary['achievements'].append('Dedicated Learner')
-        if total_sessions >= 100:
-            summary['achievements'].append('Study Master')
-        
-        if total_study_time >= 60:  # 1 hour
-            summary['achievements'].append('Hour of Power')
-        if total_study_time >= 600:  # 10 hours
-            summary['achievements'].append('Study Marathon')
-        if total_study_time >= 3000:  # 50 hours
-            summary['achievements'].append('Learning Legend')
-        
-        if current_streak >= 3:
-            summary['achievements'].append('Consistency Champion')
-        if current_streak >= 7:
-            summary['achievements'].append('Week Warrior')
-        if current_streak >= 30:
-            summary['achievements'].append('Monthly Master')
-        
-        if avg_focus >= 80:
-            summary['achievements'].append('Focus Expert')
-        if avg_focus >= 90:
-            summary['achievements'].append('Concentration King')
-        
-        return jsonify(summary), 200
+        summary['achievements'] = _earned_achievements({
+            'total_sessions': total_sessions,
+            'total_study_time': total_study_time,
+            'current_streak': current_streak,
+            'avg_focus': avg_focus
+        })
+        
+        cache_set(cache_key, summary, current_app.config['USER_STATS_CACHE_TTL'])
+        
+        return _conditional_json(summary)
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch stats summary', 'details': str(e)}), 500
@@ -340,12 +374,23 @@ def delete_account():
         if 'password' not in data:
             return jsonify({'error': 'Password confirmation required'}), 400
         
-        if not user.check_password(data['password']):
+        if not run_blocking(user.check_password, data['password']):
             return jsonify({'error': 'Incorrect password'}), 401
         
-        # Delete user (cascade will delete related data)
-        db.session.delete(user)
+        # Bulk-delete children before the user in one transaction; the foreign keys don't cascade
+        user_sessions = select(StudySession.id).where(StudySession.user_id == user_id)
+        db.session.execute(delete(EyeTrackingData).where(EyeTrackingData.session_id.in_(user_sessions)))
+        db.session.execute(delete(UserAnalytics).where(UserAnalytics.user_id == user_id))
+        db.session.execute(delete(StudySession).where(StudySession.user_id == user_id))
+        db.session.execute(delete(User).where(User.id == user_id))
         db.session.commit()
+        invalidate_user(user_id)
+        invalidate_active_session(user_id)
+        invalidate_user_stats(user_id)
+        
+        # The deleted user's token must not keep working until it expires
+        token = get_jwt()
+        revoke_token(token['jti'], int(token['exp'] - time.time()))
         
         return jsonify({
             'message': 'Account deleted successfully'
@@ -0,0 +1,65 @@
+"""
+Background analytics tasks, run off the request path
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from sqlalchemy import select, bindparam
+from sqlalchemy.exc import IntegrityError
+from models.database import db
+from models.analytics import UserAnalytics
+from utils.cache import invalidate_dashboard, invalidate_user_stats
+from utils.helpers import submit_with_app_context
+
+logger = logging.getLogger(__name__)
+
+# Rollups are cheap to queue and rare; two workers keep a burst of session ends moving
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='analytics')
+
+# Built once so every per-day lookup reuses the cached compiled statement
+_ANALYTICS_BY_DATE = select(UserAnalytics).where(
+    UserAnalytics.user_id == bindparam('uid'),
+    UserAnalytics.date == bindparam('day')
+)
+
+def find_daily_analytics(user_id, day):
+    """Load a user's analytics row for one day, or None"""
+    return db.session.execute(_ANALYTICS_BY_DATE, {'uid': user_id, 'day': day}).scalars().first()
+
+def get_or_create_daily_analytics(user_id, day):
+    """Load a user's analytics row for one day, inserting it if missing
+    
+    Returns (analytics, created). The unique (user_id, date) index rejects a
+    concurrent insert of the same day; the loser re-reads the winner's row.
+    """
+    analytics = find_daily_analytics(user_id, day)
+    if analytics:
+        return analytics, False
+    
+    analytics = UserAnalytics(user_id=user_id, date=day)
+    db.session.add(analytics)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return find_daily_analytics(user_id, day), False
+    return analytics, True
+
+def recompute_daily_analytics(user_id, day):
+    """Create or refresh a user's analytics row for one day"""
+    try:
+        analytics, _ = get_or_create_daily_analytics(user_id, day)
+        analytics.calculate_daily_metrics()
+        db.session.commit()
+        
+        # The dashboard and stats may have been rebuilt from the old rollup meanwhile
+        invalidate_dashboard(user_id)
+        invalidate_user_stats(user_id)
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to recompute analytics for user {user_id} on {day}: {e}")
+
+def enqueue_daily_analytics(user_id, day):
+    """Schedule recompute_daily_analytics in its own app context"""
+    return submit_with_app_context(_executor, recompute_daily_analytics, user_id, day)
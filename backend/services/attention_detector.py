@@ -5,13 +5,171 @@ AI attention detection service using TensorFlow and computer vision
 import tensorflow as tf
 import numpy as np
 import cv2
-from datetime import datetime, timedelta
+from collections import deque
+from datetime import datetime
+import functools
 import joblib
+import numba
 import os
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 
+# Per-frame tracking fields read from the history window by extract_features
+_TRACKING_COLUMNS = ('gaze_x', 'gaze_y', 'head_pitch', 'head_yaw', 'is_blinking')
+
+# Models kept by the detector; each is saved as <name>_model.joblib plus a flattened <name>_forest
+_MODEL_NAMES = ('attention', 'distraction', 'fatigue')
+
+# Default forest size, trees added per retrain, and the size at which a retrain rebuilds instead
+_FOREST_TREES = 32
+_RETRAIN_TREES = 20
+_MAX_FOREST_TREES = 96
+
+# Labels for analyze_attention, indexed by model prediction
+_FOCUS_LEVELS = np.array(['low', 'medium', 'high'])
+_DISTRACTION_TYPES = np.array(['none', 'phone', 'looking_away', 'closed_eyes'])
+_FATIGUE_LEVELS = np.array(['alert', 'tired', 'very_tired'])
+
+# Returned when analysis fails, so callers always get a complete result
+_FALLBACK_ANALYSIS = {
+    'attention_score': 75,
+    'focus_level': 'medium',
+    'distraction_type': 'none',
+    'fatigue_level': 'alert',
+    'eye_strain_level': 10,
+    'posture_score': 80,
+    'attention_confidence': 0.7,
+    'distraction_confidence': 0.6,
+    'fatigue_confidence': 0.8
+}
+
+# Grid step per feature for cached single-frame analysis: 1 unit for angles, rates and
+# distance, 0.05 for the 0-1 scores and the fixation duration; finer than webcam noise
+_FEATURE_QUANTA = np.array([1, 1, 0.05, 1, 1, 1, 1, 0.05, 0.05, 0.05, 1, 1, 0.05])
+
+def _model_input(features, out):
+    """Validate feature rows like sklearn and convert them to float32.
+    
+    A single row is copied into the preallocated out instead of a new array.
+    """
+    values = np.atleast_2d(features)
+    if values.ndim != 2 or values.shape[1] != out.shape[1]:
+        raise ValueError(f"Expected rows of {out.shape[1]} features, got shape {values.shape}")
+    if len(values) == 1:
+        out[0] = values[0]
+        X = out
+    else:
+        X = np.ascontiguousarray(values, dtype=np.float32)
+    if not np.isfinite(X).all():
+        raise ValueError("Features contain NaN or infinity")
+    return X
+
+def _floor_float32(values):
+    """Largest float32 not greater than each float64 value"""
+    rounded = values.astype(np.float32)
+    too_high = rounded > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+@numba.njit(cache=True)
+def _walk_forest(X, feature, threshold, left, right, value, out):
+    """Average leaf class probabilities over all trees for each row of X into out
+    
+    Tables are float32 but sums accumulate in out (float64), tree by tree in sklearn's
+    order; fastmath is left off so that order is kept.
+    """
+    n_trees = feature.shape[0]
+    n_classes = out.shape[1]
+    for r in range(X.shape[0]):
+        for c in range(n_classes):
+            out[r, c] = 0.0
+        for t in range(n_trees):
+            node = 0
+            while feature[t, node] >= 0:
+                if X[r, feature[t, node]] <= threshold[t, node]:
+                    node = left[t, node]
+                else:
+                    node = right[t, node]
+            for c in range(n_classes):
+                out[r, c] += value[t, node, c]
+        for c in range(n_classes):
+            out[r, c] /= n_trees
+
+class _FlatForest:
+    """A fitted forest flattened into padded (n_trees, n_nodes) node arrays.
+    
+    Saved as plain .npy files and memory-mapped on load, so worker processes share the
+    tree tables through the page cache instead of each unpickling its own copy.
+    """
+    
+    FIELDS = ('feature', 'threshold', 'left', 'right', 'value', 'classes')
+    
+    def __init__(self, feature, threshold, left, right, value, classes):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.classes = classes
+    
+    @classmethod
+    def from_model(cls, model):
+        """Flatten a fitted RandomForestClassifier into float32 tables; leaf values are stored as class probabilities
+        
+        Thresholds are rounded down to float32. Features are float32 too, so x <= threshold
+        takes the same branch as sklearn's float64 comparison.
+        """
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        n_trees = len(trees)
+        n_nodes = max(tree.node_count for tree in trees)
+        n_classes = model.n_classes_
+        
+        # Padding nodes look like leaves (feature -2) and are never reached
+        feature = np.full((n_trees, n_nodes), -2, dtype=np.int32)
+        threshold = np.zeros((n_trees, n_nodes), dtype=np.float32)
+        left = np.zeros((n_trees, n_nodes), dtype=np.int32)
+        right = np.zeros((n_trees, n_nodes), dtype=np.int32)
+        value = np.zeros((n_trees, n_nodes, n_classes), dtype=np.float32)
+        
+        for i, tree in enumerate(trees):
+            n = tree.node_count
+            feature[i, :n] = tree.feature
+            threshold[i, :n] = _floor_float32(tree.threshold)
+            left[i, :n] = tree.children_left
+            right[i, :n] = tree.children_right
+            counts = tree.value[:, 0, :n_classes]
+            normalizer = counts.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value[i, :n] = counts / normalizer
+        
+        return cls(feature, threshold, left, right, value, model.classes_)
+    
+    @classmethod
+    def paths(cls, prefix):
+        """Files backing a saved forest"""
+        return [f"{prefix}_{field}.npy" for field in cls.FIELDS]
+    
+    @classmethod
+    def load(cls, prefix):
+        """Memory-map a saved forest read-only"""
+        return cls(*(np.asarray(np.load(path, mmap_mode='r')) for path in cls.paths(prefix)))
+    
+    def save(self, prefix):
+        """Write each table to its own .npy file (.npz archives cannot be memory-mapped)"""
+        for field, path in zip(self.FIELDS, self.paths(prefix)):
+            np.save(path, getattr(self, field))
+    
+    def predict_proba(self, X):
+        """The source forest's predict_proba(X), to float32 precision, for rows from _model_input"""
+        proba = np.empty((X.shape[0], self.value.shape[2]))
+        _walk_forest(X, self.feature, self.threshold, self.left, self.right, self.value, proba)
+        return proba
+    
+    def predict(self, X):
+        """Same result as the source forest's predict(X)"""
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
 class AttentionDetector:
     """AI-powered attention detection using machine learning"""
     
@@ -21,25 +179,50 @@ class AttentionDetector:
         self.distraction_model = None
         self.fatigue_model = None
         
+        # Flattened copies of the models used for prediction
+        self.attention_forest = None
+        self.distraction_forest = None
+        self.fatigue_forest = None
+        
         # Feature extractors
-        self.feature_history = []
         self.history_window = 30  # seconds of history
+        self.history_fps = 30  # frame rate the window is sized for
+        self.feature_history = deque(maxlen=self.history_window * self.history_fps)
+        
+        # Scratch feature row filled by extract_features and shared by the three models
+        self._feature_buf = np.empty((1, 13), dtype=np.float32)
+        
+        # Consecutive frames mostly land in the same feature bucket; cleared when models change
+        self._bucket_analysis = functools.lru_cache(maxsize=256)(self._analyze_bucket)
         
         # Load or create models
         self._load_or_create_models()
         
+    def _model_file(self, name):
+        """Path of a saved sklearn model"""
+        return os.path.join(self.model_path, f'{name}_model.joblib')
+    
+    def _forest_prefix(self, name):
+        """Path prefix of a saved flattened forest"""
+        return os.path.join(self.model_path, f'{name}_forest')
+    
     def _load_or_create_models(self):
         """Load existing models or create new ones"""
         try:
             # Try to load existing models
-            attention_model_file = os.path.join(self.model_path, 'attention_model.joblib')
-            distraction_model_file = os.path.join(self.model_path, 'distraction_model.joblib')
-            fatigue_model_file = os.path.join(self.model_path, 'fatigue_model.joblib')
-            
-            if all(os.path.exists(f) for f in [attention_model_file, distraction_model_file, fatigue_model_file]):
-                self.attention_model = joblib.load(attention_model_file)
-                self.distraction_model = joblib.load(distraction_model_file)
-                self.fatigue_model = joblib.load(fatigue_model_file)
+            model_files = [self._model_file(name) for name in _MODEL_NAMES]
+            forest_files = [path for name in _MODEL_NAMES for path in _FlatForest.paths(self._forest_prefix(name))]
+            
+            if all(os.path.exists(f) for f in model_files + forest_files):
+                # Prediction only needs the tables; sklearn models load on demand for retraining
+                self.attention_forest = _FlatForest.load(self._forest_prefix('attention'))
+                self.distraction_forest = _FlatForest.load(self._forest_prefix('distraction'))
+                self.fatigue_forest = _FlatForest.load(self._forest_prefix('fatigue'))
+                print("Loaded existing AI models")
+            elif all(os.path.exists(f) for f in model_files):
+                # Saved before the flattened format existed; convert once
+                self._load_estimators()
+                self._save_models()
                 print("Loaded existing AI models")
             else:
                 print("Creating new AI models with default parameters")
@@ -49,30 +232,81 @@ class AttentionDetector:
             print(f"Error loading models: {e}")
             self._create_default_models()
     
+    def _load_estimators(self):
+        """Load the saved sklearn models if they are not in memory yet"""
+        if self.attention_model is not None:
+            return
+        self.attention_model = joblib.load(self._model_file('attention'))
+        self.distraction_model = joblib.load(self._model_file('distraction'))
+        self.fatigue_model = joblib.load(self._model_file('fatigue'))
+        self._set_n_jobs(1)
+    
+    def _save_models(self):
+        """Save the sklearn models and refresh their flattened copies"""
+        os.makedirs(self.model_path, exist_ok=True)
+        for name in _MODEL_NAMES:
+            model = getattr(self, f'{name}_model')
+            forest = _FlatForest.from_model(model)
+            joblib.dump(model, self._model_file(name))
+            forest.save(self._forest_prefix(name))
+            setattr(self, f'{name}_forest', forest)
+        self._bucket_analysis.cache_clear()
+    
     def _create_default_models(self):
         """Create default machine learning models"""
-        # Create basic models with default parameters
+        # Small forests: 13 features and ~1000 training samples don't need more trees,
+        # and every tree is walked on every frame
         self.attention_model = RandomForestClassifier(
-            n_estimators=100,
+            n_estimators=_FOREST_TREES,
             max_depth=10,
-            random_state=42
+            min_samples_leaf=5,
+            random_state=42,
+            n_jobs=-1,
+            warm_start=True
         )
         
         self.distraction_model = RandomForestClassifier(
-            n_estimators=100,
+            n_estimators=_FOREST_TREES,
             max_depth=8,
-            random_state=42
+            min_samples_leaf=5,
+            random_state=42,
+            n_jobs=-1,
+            warm_start=True
         )
         
         self.fatigue_model = RandomForestClassifier(
-            n_estimators=100,
+            n_estimators=_FOREST_TREES,
             max_depth=6,
-            random_state=42
+            min_samples_leaf=5,
+            random_state=42,
+            n_jobs=-1,
+            warm_start=True
         )
         
         # Train with synthetic data if no real data available
         self._train_with_synthetic_data()
     
+    def _set_n_jobs(self, n_jobs):
+        """Set tree-level parallelism on all models (all cores for fitting, serial for per-frame predict)"""
+        for model in (self.attention_model, self.distraction_model, self.fatigue_model):
+            model.n_jobs = n_jobs
+    
+    def _refit(self, model, X, y):
+        """Grow a fitted forest with trees trained on new data, rebuilding it when that can't be done
+        
+        Growing only works while the label set is unchanged (old trees are indexed by the
+        old classes) and the forest is under _MAX_FOREST_TREES, since every tree is walked
+        on every frame.
+        """
+        grown = model.n_estimators + _RETRAIN_TREES
+        if np.array_equal(np.unique(y), model.classes_) and grown <= _MAX_FOREST_TREES:
+            model.set_params(n_estimators=grown, warm_start=True)
+            model.fit(X, y)
+        else:
+            model.set_params(n_estimators=_FOREST_TREES, warm_start=False)
+            model.fit(X, y)
+            model.set_params(warm_start=True)
+    
     def _train_with_synthetic_data(self):
         """Train models with synthetic data for initial functionality"""
         print("Training models with synthetic data...")
@@ -95,168 +329,138 @@ class AttentionDetector:
         self.distraction_model.fit(features, distraction_labels)
         self.fatigue_model.fit(features, fatigue_labels)
         
+        # Per-frame predictions are single rows; joblib dispatch would cost more than the trees
+        self._set_n_jobs(1)
+        
         # Save models
-        os.makedirs(self.model_path, exist_ok=True)
-        joblib.dump(self.attention_model, os.path.join(self.model_path, 'attention_model.joblib'))
-        joblib.dump(self.distraction_model, os.path.join(self.model_path, 'distraction_model.joblib'))
-        joblib.dump(self.fatigue_model, os.path.join(self.model_path, 'fatigue_model.joblib'))
+        self._save_models()
         
         print("Models trained and saved successfully")
     
     def _generate_synthetic_features(self, n_samples):
         """Generate synthetic feature data for training"""
-        np.random.seed(42)
-        
-        features = []
-        for _ in range(n_samples):
-            # Gaze features
-            gaze_x = np.random.normal(0, 10)  # Center-focused gaze
-            gaze_y = np.random.normal(0, 10)
-            gaze_stability = np.random.uniform(0.5, 1.0)
-            
-            # Head pose features
-            head_pitch = np.random.normal(0, 15)
-            head_yaw = np.random.normal(0, 20)
-            head_roll = np.random.normal(0, 10)
-            
-            # Eye features
-            blink_rate = np.random.uniform(10, 30)  # blinks per minute
-            eye_openness = np.random.uniform(0.3, 1.0)
-            pupil_dilation = np.random.uniform(0.4, 0.8)
-            
-            # Temporal features
-            gaze_fixation_duration = np.random.uniform(0.1, 3.0)  # seconds
-            movement_frequency = np.random.uniform(0, 20)  # movements per minute
-            
-            # Distance and posture
-            distance_from_screen = np.random.uniform(40, 100)  # cm
-            posture_score = np.random.uniform(0.3, 1.0)
-            
-            features.append([
-                gaze_x, gaze_y, gaze_stability, head_pitch, head_yaw, head_roll,
-                blink_rate, eye_openness, pupil_dilation, gaze_fixation_duration,
-                movement_frequency, distance_from_screen, posture_score
-            ])
+        rng = np.random.default_rng(42)
+        
+        # One draw per feature column instead of 13 scalar draws per sample
+        features = np.empty((n_samples, 13), dtype=np.float32)
+        
+        # Gaze features
+        features[:, 0] = rng.normal(0, 10, n_samples)  # gaze_x, center-focused
+        features[:, 1] = rng.normal(0, 10, n_samples)  # gaze_y
+        features[:, 2] = rng.uniform(0.5, 1.0, n_samples)  # gaze_stability
+        
+        # Head pose features
+        features[:, 3] = rng.normal(0, 15, n_samples)  # head_pitch
+        features[:, 4] = rng.normal(0, 20, n_samples)  # head_yaw
+        features[:, 5] = rng.normal(0, 10, n_samples)  # head_roll
+        
+        # Eye features
+        features[:, 6] = rng.uniform(10, 30, n_samples)  # blink_rate, blinks per minute
+        features[:, 7] = rng.uniform(0.3, 1.0, n_samples)  # eye_openness
+        features[:, 8] = rng.uniform(0.4, 0.8, n_samples)  # pupil_dilation
         
-        return np.array(features)
+        # Temporal features
+        features[:, 9] = rng.uniform(0.1, 3.0, n_samples)  # gaze_fixation_duration, seconds
+        features[:, 10] = rng.uniform(0, 20, n_samples)  # movement_frequency, movements per minute
+        
+        # Distance and posture
+        features[:, 11] = rng.uniform(40, 100, n_samples)  # distance_from_screen, cm
+        features[:, 12] = rng.uniform(0.3, 1.0, n_samples)  # posture_score
+        
+        return features
     
     def _generate_attention_labels(self, features):
         """Generate attention labels based on feature patterns"""
-        labels = []
-        for feature in features:
-            gaze_x, gaze_y, gaze_stability, head_pitch, head_yaw, head_roll, \
-            blink_rate, eye_openness, pupil_dilation, fixation_duration, \
-            movement_freq, distance, posture = feature
-            
-            # Calculate attention score based on multiple factors
-            attention_score = 1.0
-            
-            # Gaze factors
-            if abs(gaze_x) > 15 or abs(gaze_y) > 15:
-                attention_score -= 0.3
-            if gaze_stability < 0.7:
-                attention_score -= 0.2
-            
-            # Head pose factors
-            if abs(head_pitch) > 20 or abs(head_yaw) > 25:
-                attention_score -= 0.3
-            
-            # Eye factors
-            if eye_openness < 0.6:
-                attention_score -= 0.4
-            if blink_rate > 25 or blink_rate < 12:
-                attention_score -= 0.1
-            
-            # Movement factors
-            if movement_freq > 15:
-                attention_score -= 0.2
-            
-            # Distance and posture
-            if distance > 80 or distance < 50:
-                attention_score -= 0.1
-            if posture < 0.6:
-                attention_score -= 0.1
-            
-            # Binary classification
-            labels.append(1 if attention_score > 0.6 else 0)
+        gaze_x, gaze_y, gaze_stability, head_pitch, head_yaw, head_roll, \
+        blink_rate, eye_openness, pupil_dilation, fixation_duration, \
+        movement_freq, distance, posture = features.T
+        
+        # Calculate attention score based on multiple factors; penalties are
+        # applied in the same order as the per-sample rules so rounding matches
+        attention_score = np.ones(len(features))
+        
+        # Gaze factors
+        attention_score -= 0.3 * ((np.abs(gaze_x) > 15) | (np.abs(gaze_y) > 15))
+        attention_score -= 0.2 * (gaze_stability < 0.7)
+        
+        # Head pose factors
+        attention_score -= 0.3 * ((np.abs(head_pitch) > 20) | (np.abs(head_yaw) > 25))
+        
+        # Eye factors
+        attention_score -= 0.4 * (eye_openness < 0.6)
+        attention_score -= 0.1 * ((blink_rate > 25) | (blink_rate < 12))
         
-        return np.array(labels)
+        # Movement factors
+        attention_score -= 0.2 * (movement_freq > 15)
+        
+        # Distance and posture
+        attention_score -= 0.1 * ((distance > 80) | (distance < 50))
+        attention_score -= 0.1 * (posture < 0.6)
+        
+        # Binary classification
+        return (attention_score > 0.6).astype(np.int64)
     
     def _generate_distraction_labels(self, features):
         """Generate distraction type labels"""
-        labels = []
-        for feature in features:
-            gaze_x, gaze_y, gaze_stability, head_pitch, head_yaw, head_roll, \
-            blink_rate, eye_openness, pupil_dilation, fixation_duration, \
-            movement_freq, distance, posture = feature
-            
-            # Determine distraction type
-            if eye_openness < 0.3:
-                labels.append(3)  # closed_eyes
-            elif abs(head_yaw) > 30 or abs(gaze_x) > 25:
-                labels.append(2)  # looking_away
-            elif movement_freq > 20 and gaze_stability < 0.5:
-                labels.append(1)  # phone/device
-            else:
-                labels.append(0)  # no distraction
-        
-        return np.array(labels)
+        gaze_x, gaze_y, gaze_stability, head_pitch, head_yaw, head_roll, \
+        blink_rate, eye_openness, pupil_dilation, fixation_duration, \
+        movement_freq, distance, posture = features.T
+        
+        # Determine distraction type; the first matching condition wins
+        return np.select(
+            [
+                eye_openness < 0.3,  # closed_eyes
+                (np.abs(head_yaw) > 30) | (np.abs(gaze_x) > 25),  # looking_away
+                (movement_freq > 20) & (gaze_stability < 0.5)  # phone/device
+            ],
+            [3, 2, 1],
+            default=0  # no distraction
+        )
     
     def _generate_fatigue_labels(self, features):
         """Generate fatigue level labels"""
-        labels = []
-        for feature in features:
-            gaze_x, gaze_y, gaze_stability, head_pitch, head_yaw, head_roll, \
-            blink_rate, eye_openness, pupil_dilation, fixation_duration, \
-            movement_freq, distance, posture = feature
-            
-            # Calculate fatigue score
-            fatigue_score = 0
-            
+        gaze_x, gaze_y, gaze_stability, head_pitch, head_yaw, head_roll, \
+        blink_rate, eye_openness, pupil_dilation, fixation_duration, \
+        movement_freq, distance, posture = features.T
+        
+        # Calculate fatigue score
+        fatigue_score = (
             # Blink rate indicator
-            if blink_rate > 25:
-                fatigue_score += 1
-            if blink_rate > 30:
-                fatigue_score += 1
-            
+            (blink_rate > 25).astype(np.int64) + (blink_rate > 30) +
             # Eye openness
-            if eye_openness < 0.7:
-                fatigue_score += 1
-            if eye_openness < 0.5:
-                fatigue_score += 1
-            
+            (eye_openness < 0.7) + (eye_openness < 0.5) +
             # Head position (drooping)
-            if head_pitch > 15:
-                fatigue_score += 1
-            
+            (head_pitch > 15) +
             # Gaze stability (tired eyes wander)
-            if gaze_stability < 0.6:
-                fatigue_score += 1
-            
+            (gaze_stability < 0.6) +
             # Movement frequency (restlessness or sluggishness)
-            if movement_freq > 25 or movement_freq < 5:
-                fatigue_score += 1
-            
-            # Classify fatigue level
-            if fatigue_score >= 4:
-                labels.append(2)  # very_tired
-            elif fatigue_score >= 2:
-                labels.append(1)  # tired
-            else:
-                labels.append(0)  # alert
+            ((movement_freq > 25) | (movement_freq < 5))
+        )
         
-        return np.array(labels)
+        # Classify fatigue level
+        return np.select(
+            [fatigue_score >= 4, fatigue_score >= 2],
+            [2, 1],  # very_tired, tired
+            default=0  # alert
+        )
     
     def extract_features(self, tracking_data_history):
-        """Extract features from tracking data history"""
+        """Extract features from tracking data history
+        
+        Returns the detector's (1, 13) scratch row, which the next extract or predict
+        call overwrites; copy it to keep it.
+        """
         if not tracking_data_history:
             return None
         
-        # Convert to numerical features
-        features = []
-        
-        # Latest data point
+        # Convert the window we need into columns in a single pass
         latest = tracking_data_history[-1]
+        window = tracking_data_history[-30:]
+        columns = np.array(
+            [[d.get(key) or 0 for key in _TRACKING_COLUMNS] for d in window],
+            dtype=float
+        )
+        recent_gaze_x, recent_gaze_y, recent_pitch, recent_yaw, blinking = columns.T
         
         # Gaze features
         gaze_x = latest.get('gaze_x', 0) or 0
@@ -264,9 +468,7 @@ class AttentionDetector:
         
         # Calculate gaze stability (variance over time)
         if len(tracking_data_history) >= 5:
-            recent_gaze_x = [d.get('gaze_x', 0) or 0 for d in tracking_data_history[-5:]]
-            recent_gaze_y = [d.get('gaze_y', 0) or 0 for d in tracking_data_history[-5:]]
-            gaze_stability = 1.0 / (1.0 + np.var(recent_gaze_x) + np.var(recent_gaze_y))
+            gaze_stability = 1.0 / (1.0 + recent_gaze_x[-5:].var() + recent_gaze_y[-5:].var())
         else:
             gaze_stability = 0.5
         
@@ -279,8 +481,8 @@ class AttentionDetector:
         eye_openness = 1.0 if not latest.get('is_blinking', False) else 0.3
         
         # Calculate blink rate
-        blink_count = sum(1 for d in tracking_data_history[-30:] if d.get('is_blinking', False))
-        blink_rate = (blink_count / min(len(tracking_data_history), 30)) * 60  # per minute
+        blink_count = np.count_nonzero(blinking)
+        blink_rate = (blink_count / len(window)) * 60  # per minute
         
         # Pupil dilation (placeholder - would need actual pupil size data)
         pupil_dilation = 0.6  # Default value
@@ -288,19 +490,13 @@ class AttentionDetector:
         # Temporal features
         gaze_fixation_duration = 1.0  # Placeholder
         
-        # Movement frequency (head movement)
+        # Movement frequency (head movement between the last 10 frames)
         if len(tracking_data_history) >= 10:
-            movement_count = 0
-            for i in range(1, min(len(tracking_data_history), 10)):
-                prev_pitch = tracking_data_history[-i-1].get('head_pitch', 0) or 0
-                curr_pitch = tracking_data_history[-i].get('head_pitch', 0) or 0
-                prev_yaw = tracking_data_history[-i-1].get('head_yaw', 0) or 0
-                curr_yaw = tracking_data_history[-i].get('head_yaw', 0) or 0
-                
-                if abs(curr_pitch - prev_pitch) > 2 or abs(curr_yaw - prev_yaw) > 2:
-                    movement_count += 1
-            
-            movement_frequency = movement_count * 6  # Scale to per minute
+            moved = (
+                (np.abs(np.diff(recent_pitch[-10:])) > 2) |
+                (np.abs(np.diff(recent_yaw[-10:])) > 2)
+            )
+            movement_frequency = int(np.count_nonzero(moved)) * 6  # Scale to per minute
         else:
             movement_frequency = 5  # Default
         
@@ -308,13 +504,42 @@ class AttentionDetector:
         distance_from_screen = latest.get('distance_cm', 65) or 65
         posture_score = 0.8  # Placeholder - would calculate from head pose
         
-        features = [
+        features = self._feature_buf
+        features[0] = (
             gaze_x, gaze_y, gaze_stability, head_pitch, head_yaw, head_roll,
             blink_rate, eye_openness, pupil_dilation, gaze_fixation_duration,
             movement_frequency, distance_from_screen, posture_score
-        ]
+        )
         
-        return np.array(features).reshape(1, -1)
+        return features
+    
+    def _extract_features_batch(self, tracking_points):
+        """Feature rows for independent tracking points, one pass over all of them
+        
+        Row i equals extract_features([tracking_points[i]]): a single frame has no
+        history, so stability and movement take their defaults.
+        """
+        raw = np.array([
+            (
+                point.get('gaze_x') or 0, point.get('gaze_y') or 0,
+                point.get('head_pitch') or 0, point.get('head_yaw') or 0, point.get('head_roll') or 0,
+                point.get('distance_cm') or 65, bool(point.get('is_blinking'))
+            )
+            for point in tracking_points
+        ], dtype=float).reshape(-1, 7)
+        blinking = raw[:, 6] > 0
+        
+        features = np.empty((len(raw), 13), dtype=np.float32)
+        features[:, [0, 1, 3, 4, 5]] = raw[:, :5]  # gaze and head pose
+        features[:, 2] = 0.5  # gaze stability
+        features[:, 6] = np.where(blinking, 60.0, 0.0)  # blink rate over one frame
+        features[:, 7] = np.where(blinking, 0.3, 1.0)  # eye openness
+        features[:, 8] = 0.6  # pupil dilation
+        features[:, 9] = 1.0  # gaze fixation duration
+        features[:, 10] = 5  # movement frequency
+        features[:, 11] = raw[:, 5]  # distance from screen
+        features[:, 12] = 0.8  # posture score
+        return features
     
     def predict_attention(self, tracking_data_history):
         """Predict attention level from tracking data"""
@@ -323,18 +548,20 @@ class AttentionDetector:
             return 0.5, False, "none", 0.5
         
         try:
+            X = _model_input(features, self._feature_buf)
+            
             # Predict attention
-            attention_prob = self.attention_model.predict_proba(features)[0]
+            attention_prob = self.attention_forest.predict_proba(X)[0]
             is_focused = attention_prob[1] > 0.6
             attention_score = attention_prob[1]
             
             # Predict distraction type
-            distraction_pred = self.distraction_model.predict(features)[0]
+            distraction_pred = self.distraction_forest.predict(X)[0]
             distraction_types = ["none", "phone", "away", "closed_eyes"]
             distraction_type = distraction_types[min(distraction_pred, len(distraction_types)-1)]
             
             # Predict fatigue level
-            fatigue_pred = self.fatigue_model.predict(features)[0]
+            fatigue_pred = self.fatigue_forest.predict(X)[0]
             fatigue_levels = [0.0, 0.5, 1.0]  # alert, tired, very_tired
             fatigue_level = fatigue_levels[min(fatigue_pred, len(fatigue_levels)-1)]
             
@@ -346,17 +573,11 @@ class AttentionDetector:
     
     def update_feature_history(self, tracking_data):
         """Update feature history with new tracking data"""
+        # Bounded deque: the oldest frame falls out once the window is full
         self.feature_history.append({
             'timestamp': tracking_data.get('timestamp', datetime.utcnow()),
             'data': tracking_data
         })
-        
-        # Keep only recent history
-        cutoff_time = datetime.utcnow() - timedelta(seconds=self.history_window)
-        self.feature_history = [
-            item for item in self.feature_history 
-            if item['timestamp'] > cutoff_time
-        ]
     
     def retrain_models(self, training_data):
         """Retrain models with new data"""
@@ -366,52 +587,54 @@ class AttentionDetector:
         
         try:
             # Extract features and labels from training data
-            features = []
-            attention_labels = []
-            distraction_labels = []
-            fatigue_labels = []
-            
-            for session_data in training_data:
-                for tracking_point in session_data['tracking_data']:
-                    feature_vector = self.extract_features([tracking_point])
-                    if feature_vector is not None:
-                        features.append(feature_vector[0])
-                        
-                        # Get labels from session data
-                        attention_labels.append(tracking_point.get('is_focused', False))
-                        distraction_labels.append(tracking_point.get('distraction_type', 'none'))
-                        fatigue_labels.append(tracking_point.get('fatigue_level', 0.0))
+            tracking_points = [
+                tracking_point
+                for session_data in training_data
+                for tracking_point in session_data['tracking_data']
+            ]
             
-            if len(features) < 100:
+            if len(tracking_points) < 100:
                 print("Insufficient feature data")
                 return False
             
-            features = np.array(features)
-            attention_labels = np.array([1 if label else 0 for label in attention_labels])
+            features = self._extract_features_batch(tracking_points)
+            
+            # Get labels from session data
+            attention_labels = np.array([1 if point.get('is_focused', False) else 0 for point in tracking_points])
             
             # Convert string labels to numerical
             distraction_map = {"none": 0, "phone": 1, "away": 2, "closed_eyes": 3}
-            distraction_labels = np.array([distraction_map.get(label, 0) for label in distraction_labels])
+            distraction_labels = np.array([distraction_map.get(point.get('distraction_type', 'none'), 0) for point in tracking_points])
             
-            fatigue_labels = np.array([min(int(label * 2), 2) for label in fatigue_labels])
+            fatigue_labels = np.array([min(int(point.get('fatigue_level', 0.0) * 2), 2) for point in tracking_points])
             
             # Split data
-            X_train, X_test, y_att_train, y_att_test = train_test_split(
-                features, attention_labels, test_size=0.2, random_state=42
+            (X_train, X_test, y_att_train, y_att_test, y_dis_train, y_dis_test,
+             y_fat_train, y_fat_test) = train_test_split(
+                features, attention_labels, distraction_labels, fatigue_labels,
+                test_size=0.2, random_state=42
             )
             
             # Retrain models
-            self.attention_model.fit(X_train, y_att_train)
+            self._load_estimators()
+            self._set_n_jobs(-1)
+            try:
+                self._refit(self.attention_model, X_train, y_att_train)
+                self._refit(self.distraction_model, X_train, y_dis_train)
+                self._refit(self.fatigue_model, X_train, y_fat_train)
+            finally:
+                self._set_n_jobs(1)
             
             # Test accuracy
-            y_att_pred = self.attention_model.predict(X_test)
-            accuracy = accuracy_score(y_att_test, y_att_pred)
+            accuracy = accuracy_score(y_att_test, self.attention_model.predict(X_test))
+            distraction_accuracy = accuracy_score(y_dis_test, self.distraction_model.predict(X_test))
+            fatigue_accuracy = accuracy_score(y_fat_test, self.fatigue_model.predict(X_test))
             
-            print(f"Model retrained with accuracy: {accuracy:.3f}")
-              # Save updated models
-            joblib.dump(self.attention_model, os.path.join(self.model_path, 'attention_model.joblib'))
-            joblib.dump(self.distraction_model, os.path.join(self.model_path, 'distraction_model.joblib'))
-            joblib.dump(self.fatigue_model, os.path.join(self.model_path, 'fatigue_model.joblib'))
+            print(f"Model retrained with accuracy: {accuracy:.3f} "
+                  f"(distraction {distraction_accuracy:.3f}, fatigue {fatigue_accuracy:.3f})")
+            
+            # Save updated models
+            self._save_models()
             
             return True
             
@@ -421,6 +644,7 @@ class AttentionDetector:
     
     def get_model_info(self):
         """Get information about the current models"""
+        self._load_estimators()
         return {
             'attention_model': type(self.attention_model).__name__ if self.attention_model else None,
             'distraction_model': type(self.distraction_model).__name__ if self.distraction_model else None,
@@ -429,84 +653,114 @@ class AttentionDetector:
             'history_window_seconds': self.history_window
         }
     
+    def _analyze_bucket(self, key):
+        """Model outputs for a point on the _FEATURE_QUANTA grid (cached per detector)"""
+        grid_point = (np.array(key) * _FEATURE_QUANTA)[np.newaxis]
+        return self._model_outputs(_model_input(grid_point, self._feature_buf))[0]
+    
+    def _model_outputs(self, X):
+        """Model-derived analysis fields for each row of X, as tuples in _analysis_dict order"""
+        n = np.arange(len(X))
+        
+        # Get predictions from all models; the predicted class is the most probable column
+        attention_confidence = self.attention_forest.predict_proba(X)
+        attention_best = attention_confidence.argmax(axis=1)
+        attention_prediction = self.attention_forest.classes.take(attention_best)
+        
+        distraction_confidence = self.distraction_forest.predict_proba(X)
+        distraction_best = distraction_confidence.argmax(axis=1)
+        distraction_prediction = self.distraction_forest.classes.take(distraction_best)
+        
+        fatigue_confidence = self.fatigue_forest.predict_proba(X)
+        fatigue_best = fatigue_confidence.argmax(axis=1)
+        fatigue_prediction = self.fatigue_forest.classes.take(fatigue_best)
+        
+        # Calculate attention score (0-100): at least 60 when focused, at most 40 otherwise
+        attention_percent = (attention_confidence * 100).astype(int)
+        attention_score = np.where(
+            attention_prediction == 1,
+            np.maximum(60, attention_percent[:, 1]),
+            np.minimum(40, attention_percent[:, 0])
+        )
+        
+        # Determine focus level
+        focus_level = _FOCUS_LEVELS[(attention_score >= 60).astype(int) + (attention_score >= 80)]
+        
+        # Map distraction types and fatigue levels (unknown predictions fall back to the first label)
+        distraction_type = _DISTRACTION_TYPES[np.where(distraction_prediction < len(_DISTRACTION_TYPES), distraction_prediction, 0)]
+        fatigue_level = _FATIGUE_LEVELS[np.where(fatigue_prediction < len(_FATIGUE_LEVELS), fatigue_prediction, 0)]
+        
+        # Calculate eye strain level (0-30, higher is worse)
+        eye_strain_level = np.clip((fatigue_confidence[n, fatigue_best] * 30).astype(int), 0, 30)
+        
+        return list(zip(
+            attention_score.tolist(), focus_level.tolist(), distraction_type.tolist(),
+            fatigue_level.tolist(), eye_strain_level.tolist(),
+            attention_confidence[n, attention_best].tolist(),
+            distraction_confidence[n, distraction_best].tolist(),
+            fatigue_confidence[n, fatigue_best].tolist()
+        ))
+    
+    @staticmethod
+    def _posture_scores(rows):
+        """Rule-based posture score (60-95, higher is better) for each row of raw features"""
+        rows = np.atleast_2d(rows)
+        gaze_x, gaze_y = rows[:, 0], rows[:, 1]
+        head_pitch, head_yaw = rows[:, 3], rows[:, 4]
+        
+        return np.maximum(60, (
+            95
+            - 15 * ((np.abs(gaze_x) > 15) | (np.abs(gaze_y) > 15))
+            - 20 * ((np.abs(head_pitch) > 20) | (np.abs(head_yaw) > 25))
+        )).tolist()
+    
+    @staticmethod
+    def _analysis_dict(outputs, posture_score):
+        """Assemble one analysis from model outputs and the posture score"""
+        score, focus, distraction, fatigue, strain, att_conf, dis_conf, fat_conf = outputs
+        return {
+            'attention_score': score,
+            'focus_level': focus,
+            'distraction_type': distraction,
+            'fatigue_level': fatigue,
+            'eye_strain_level': strain,
+            'posture_score': posture_score,
+            'attention_confidence': att_conf,
+            'distraction_confidence': dis_conf,
+            'fatigue_confidence': fat_conf
+        }
+    
     def analyze_attention(self, features):
-        """Analyze attention using the trained AI models"""
+        """Analyze attention using the trained AI models
+        
+        Accepts one feature vector, flat or as the (1, 13) row extract_features
+        returns. Model outputs come from the nearest _FEATURE_QUANTA grid point and
+        are cached, so steady frames skip the models; posture is always scored from
+        the features as given.
+        """
         try:
-            # Convert features to numpy array
-            if isinstance(features, list):
-                features_array = np.array(features).reshape(1, -1)
-            else:
-                features_array = features.reshape(1, -1)
-            
-            # Get predictions from all models
-            attention_prediction = self.attention_model.predict(features_array)[0]
-            attention_confidence = self.attention_model.predict_proba(features_array)[0]
-            
-            distraction_prediction = self.distraction_model.predict(features_array)[0]
-            distraction_confidence = self.distraction_model.predict_proba(features_array)[0]
-            
-            fatigue_prediction = self.fatigue_model.predict(features_array)[0]
-            fatigue_confidence = self.fatigue_model.predict_proba(features_array)[0]
-            
-            # Calculate attention score (0-100)
-            if attention_prediction == 1:
-                attention_score = max(60, int(attention_confidence[1] * 100))
-            else:
-                attention_score = min(40, int(attention_confidence[0] * 100))
-            
-            # Determine focus level
-            if attention_score >= 80:
-                focus_level = 'high'
-            elif attention_score >= 60:
-                focus_level = 'medium'
-            else:
-                focus_level = 'low'
-            
-            # Map distraction types
-            distraction_types = ['none', 'phone', 'looking_away', 'closed_eyes']
-            distraction_type = distraction_types[distraction_prediction] if distraction_prediction < len(distraction_types) else 'none'
-            
-            # Map fatigue levels
-            fatigue_levels = ['alert', 'tired', 'very_tired']
-            fatigue_level = fatigue_levels[fatigue_prediction] if fatigue_prediction < len(fatigue_levels) else 'alert'
-            
-            # Calculate eye strain level (0-30, higher is worse)
-            eye_strain_level = max(0, min(30, int(fatigue_confidence[fatigue_prediction] * 30)))
-            
-            # Calculate posture score (60-95, higher is better)
-            gaze_x, gaze_y = features[0], features[1]
-            head_pitch, head_yaw = features[3], features[4]
-            
-            posture_score = 95
-            if abs(gaze_x) > 15 or abs(gaze_y) > 15:
-                posture_score -= 15
-            if abs(head_pitch) > 20 or abs(head_yaw) > 25:
-                posture_score -= 20
-            posture_score = max(60, posture_score)
-            
-            return {
-                'attention_score': attention_score,
-                'focus_level': focus_level,
-                'distraction_type': distraction_type,
-                'fatigue_level': fatigue_level,
-                'eye_strain_level': eye_strain_level,
-                'posture_score': posture_score,
-                'attention_confidence': float(attention_confidence[attention_prediction]),
-                'distraction_confidence': float(distraction_confidence[distraction_prediction]),
-                'fatigue_confidence': float(fatigue_confidence[fatigue_prediction])
-            }
+            X = _model_input(features, self._feature_buf)
+            if len(X) != 1:
+                raise ValueError(f"Expected one feature row, got {len(X)}; use analyze_attention_batch")
+            key = tuple(np.rint(X[0] / _FEATURE_QUANTA).astype(np.int64).tolist())
+            outputs = self._bucket_analysis(key)
+            return self._analysis_dict(outputs, self._posture_scores(features)[0])
             
         except Exception as e:
             print(f"Error in analyze_attention: {e}")
             # Return fallback values
-            return {
-                'attention_score': 75,
-                'focus_level': 'medium',
-                'distraction_type': 'none',
-                'fatigue_level': 'alert',
-                'eye_strain_level': 10,
-                'posture_score': 80,
-                'attention_confidence': 0.7,
-                'distraction_confidence': 0.6,
-                'fatigue_confidence': 0.8
-            }
+            return dict(_FALLBACK_ANALYSIS)
+    
+    def analyze_attention_batch(self, features):
+        """Analyze an (N, 13) batch of feature rows, returning one dict per row"""
+        try:
+            rows = np.atleast_2d(features)
+            X = _model_input(rows, self._feature_buf)
+            return [
+                self._analysis_dict(outputs, posture_score)
+                for outputs, posture_score in zip(self._model_outputs(X), self._posture_scores(rows))
+            ]
+            
+        except Exception as e:
+            print(f"Error in analyze_attention_batch: {e}")
+            return [dict(_FALLBACK_ANALYSIS) for _ in range(len(features))]
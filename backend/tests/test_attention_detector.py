@@ -0,0 +1,158 @@
+"""
+Tests for the attention detector's flattened forests and feature pipelines
+"""
+
+import pytest
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from services.attention_detector import (
+    AttentionDetector, _MODEL_NAMES, _FOREST_TREES, _RETRAIN_TREES, _MAX_FOREST_TREES
+)
+
+@pytest.fixture(scope='module')
+def model_dir(tmp_path_factory):
+    """Directory the detector trains and saves its models into"""
+    return str(tmp_path_factory.mktemp('ai_models'))
+
+@pytest.fixture(scope='module')
+def detector(model_dir):
+    """Detector trained on synthetic data"""
+    return AttentionDetector(model_path=model_dir)
+
+def _threshold_rows(model, base, n_trees=3):
+    """Rows whose features sit exactly at, just below and just above split thresholds"""
+    rows = []
+    for estimator in model.estimators_[:n_trees]:
+        tree = estimator.tree_
+        for feature, threshold in zip(tree.feature, tree.threshold):
+            if feature < 0:
+                continue
+            at = np.float32(threshold)
+            for value in (at, np.nextafter(at, np.float32(-np.inf)), np.nextafter(at, np.float32(np.inf))):
+                row = base.copy()
+                row[feature] = value
+                rows.append(row)
+    return np.array(rows, dtype=np.float32)
+
+class TestFlatForest:
+    
+    def test_matches_sklearn(self, detector):
+        """Test that the flattened forests reproduce sklearn's predictions"""
+        X = detector._generate_synthetic_features(500)
+        
+        for name in _MODEL_NAMES:
+            model = getattr(detector, f'{name}_model')
+            forest = getattr(detector, f'{name}_forest')
+            rows = np.vstack([X, _threshold_rows(model, X[0])])
+            
+            np.testing.assert_allclose(forest.predict_proba(rows), model.predict_proba(rows), atol=1e-6)
+            assert (forest.predict(rows) == model.predict(rows)).all()
+    
+    def test_memory_mapped_reload(self, detector, model_dir):
+        """Test that forests reloaded from the saved tables predict the same"""
+        reloaded = AttentionDetector(model_path=model_dir)
+        X = detector._generate_synthetic_features(200)
+        
+        # Prediction runs from the mapped tables; sklearn models are loaded on demand
+        assert reloaded.attention_model is None
+        
+        for name in _MODEL_NAMES:
+            model = getattr(detector, f'{name}_model')
+            forest = getattr(reloaded, f'{name}_forest')
+            rows = np.vstack([X, _threshold_rows(model, X[0])])
+            
+            assert not forest.threshold.flags.writeable
+            np.testing.assert_allclose(forest.predict_proba(rows), model.predict_proba(rows), atol=1e-6)
+
+class TestRefit:
+    
+    @staticmethod
+    def _fitted_forest(X, y, n_estimators=_FOREST_TREES):
+        """Small warm-startable forest like the detector's"""
+        model = RandomForestClassifier(n_estimators=n_estimators, max_depth=4, random_state=0, warm_start=True)
+        return model.fit(X, y)
+    
+    def test_grows_forest_when_classes_match(self, detector):
+        """Test that retraining adds trees to a forest with the same label set"""
+        X = detector._generate_synthetic_features(300)
+        y = detector._generate_fatigue_labels(X)
+        model = self._fitted_forest(X, y)
+        first_trees = list(model.estimators_)
+        
+        detector._refit(model, X[::-1], y[::-1])
+        
+        assert model.n_estimators == _FOREST_TREES + _RETRAIN_TREES
+        assert len(model.estimators_) == model.n_estimators
+        assert model.estimators_[:_FOREST_TREES] == first_trees
+    
+    def test_rebuilds_when_classes_change(self, detector):
+        """Test that a new label set rebuilds the forest instead of mixing class orders"""
+        X = detector._generate_synthetic_features(300)
+        y = detector._generate_fatigue_labels(X)
+        model = self._fitted_forest(X, y)
+        
+        new_y = np.minimum(y, 1)
+        detector._refit(model, X, new_y)
+        
+        assert model.n_estimators == _FOREST_TREES
+        assert len(model.estimators_) == _FOREST_TREES
+        assert list(model.classes_) == [0, 1]
+        assert model.predict_proba(X).shape == (len(X), 2)
+        assert model.warm_start
+    
+    def test_rebuilds_at_tree_cap(self, detector):
+        """Test that a forest that would outgrow the cap is rebuilt at the default size"""
+        X = detector._generate_synthetic_features(300)
+        y = detector._generate_fatigue_labels(X)
+        model = self._fitted_forest(X, y, n_estimators=_MAX_FOREST_TREES - _RETRAIN_TREES + 1)
+        
+        detector._refit(model, X, y)
+        
+        assert model.n_estimators == _FOREST_TREES
+        assert len(model.estimators_) == _FOREST_TREES
+
+class TestBatchFeatures:
+    
+    def test_matches_single_point_extraction(self, detector):
+        """Test that batch rows equal extract_features on each point alone"""
+        points = [
+            {'gaze_x': 0.2, 'gaze_y': -0.1, 'head_pitch': 5, 'head_yaw': -3.5,
+             'head_roll': 1, 'is_blinking': False, 'distance_cm': 58},
+            {'gaze_x': None, 'gaze_y': None, 'head_pitch': None, 'head_yaw': None,
+             'head_roll': None, 'is_blinking': None, 'distance_cm': None},
+            {'gaze_x': 1, 'gaze_y': 0, 'head_pitch': -12, 'head_yaw': 20,
+             'head_roll': 0, 'is_blinking': 1},
+            {'gaze_x': -0.75, 'head_yaw': 8.25, 'is_blinking': True, 'distance_cm': 0},
+            {'is_blinking': 0, 'distance_cm': 72.5},
+            {}
+        ]
+        
+        batch = detector._extract_features_batch(points)
+        
+        assert batch.shape == (len(points), 13)
+        assert batch.dtype == np.float32
+        for row, point in zip(batch, points):
+            np.testing.assert_array_equal(row, detector.extract_features([point])[0])
+
+class TestAnalyzeAttention:
+    
+    def test_single_row_returns_dict(self, detector):
+        """Test that extract_features' (1, 13) row and a flat vector both give one dict"""
+        features = detector.extract_features([{'gaze_x': 0.1, 'head_pitch': 4, 'distance_cm': 60}])
+        flat = features[0].copy()
+        
+        from_row = detector.analyze_attention(features)
+        from_flat = detector.analyze_attention(flat)
+        
+        assert isinstance(from_row, dict)
+        assert from_row == from_flat
+    
+    def test_batch_matches_single_rows(self, detector):
+        """Test that the batch method returns one dict per row"""
+        rows = detector._generate_synthetic_features(8)
+        
+        results = detector.analyze_attention_batch(rows)
+        
+        assert len(results) == len(rows)
+        for result, row in zip(results, rows):
+            assert result['posture_score'] == detector.analyze_attention(row)['posture_score']
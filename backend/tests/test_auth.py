@@ -136,3 +136,34 @@ class TestAuthRoutes:
         response = client.post('/api/auth/logout')
         
         assert response.status_code == 401
+    
+    def test_refresh_deleted_user(self, client, auth_token, auth_headers):
+        """Test that a deleted user cannot refresh their token"""
+        token = auth_token()
+        
+        user = User.query.filter_by(email='test@example.com').first()
+        db.session.delete(user)
+        db.session.commit()
+        
+        response = client.post('/api/auth/refresh', 
+                             headers=auth_headers(token))
+        
+        assert response.status_code == 404
+    
+    def test_delete_account_with_sessions(self, client, auth_token, auth_headers):
+        """Test deleting an account that owns study sessions"""
+        from models.session import StudySession
+        token = auth_token()
+        
+        response = client.post('/api/sessions/', 
+                             headers=auth_headers(token),
+                             json={'title': 'Algebra practice'})
+        assert response.status_code == 201
+        
+        response = client.delete('/api/users/delete', 
+                               headers=auth_headers(token),
+                               json={'password': 'testpass123'})
+        
+        assert response.status_code == 200
+        assert User.query.filter_by(email='test@example.com').first() is None
+        assert StudySession.query.count() == 0
@@ -5,9 +5,34 @@ Tests for session management routes
 import pytest
 import json
 from datetime import datetime, timedelta
+import sqlalchemy as sa
 from models.session import StudySession
 from models.database import db
 
+@pytest.fixture
+def active_session_index(app):
+    """Add the migrated one-active-session-per-user index, which create_all() does not build"""
+    sa.Index(
+        'ux_ss_active_user',
+        StudySession.__table__.c.user_id,
+        unique=True,
+        sqlite_where=sa.text('is_active'),
+        postgresql_where=sa.text('is_active')
+    ).create(db.engine)
+
+@pytest.fixture
+def skip_first_active_check(monkeypatch):
+    """Let the first pre-write active-session check miss, as when a concurrent start wins the race"""
+    import routes.session_routes as session_routes
+    check = session_routes._active_conflict_id
+    calls = []
+    
+    def _racing_check(user_id):
+        calls.append(user_id)
+        return 0 if len(calls) == 1 else check(user_id)
+    
+    monkeypatch.setattr(session_routes, '_active_conflict_id', _racing_check)
+
 class TestSessionRoutes:
     
     def test_start_session_success(self, client, auth_token, auth_headers):
@@ -203,3 +228,143 @@ class TestSessionRoutes:
             assert response.status_code == 401
             data = response.get_json()
             assert 'authentication' in data['error']['message'].lower()
+    
+    def _add_completed_sessions(self, start_times):
+        """Insert finished sessions for the test user and return their ids"""
+        from models.user import User
+        user = User.query.filter_by(email='test@example.com').first()
+        
+        sessions = [
+            StudySession(
+                user_id=user.id,
+                title=f'Session {i}',
+                planned_duration=25,
+                start_time=start_time,
+                end_time=start_time + timedelta(minutes=25),
+                status='completed',
+                is_active=False
+            )
+            for i, start_time in enumerate(start_times)
+        ]
+        db.session.add_all(sessions)
+        db.session.commit()
+        return [session.id for session in sessions]
+    
+    def _list_all_pages(self, client, headers, per_page):
+        """Follow next_cursor through every page and return the listed ids"""
+        response = client.get(f'/api/sessions/?per_page={per_page}', headers=headers)
+        assert response.status_code == 200
+        data = response.get_json()
+        ids = [session['id'] for session in data['sessions']]
+        
+        while data['pagination']['next_cursor']:
+            response = client.get('/api/sessions/',
+                                headers=headers,
+                                query_string={'per_page': per_page,
+                                              'before': data['pagination']['next_cursor']})
+            assert response.status_code == 200
+            data = response.get_json()
+            assert data['pagination']['total'] is None
+            ids.extend(session['id'] for session in data['sessions'])
+        
+        return ids
+    
+    def test_get_sessions_cursor_round_trip(self, client, auth_token, auth_headers):
+        """Test paging through history with next_cursor"""
+        token = auth_token()
+        now = datetime.utcnow()
+        ids = self._add_completed_sessions([now - timedelta(hours=i) for i in range(5)])
+        
+        response = client.get('/api/sessions/?per_page=2', headers=auth_headers(token))
+        data = response.get_json()
+        assert data['pagination']['total'] == 5
+        assert data['pagination']['has_next'] is True
+        
+        # Newest first, every session exactly once
+        assert self._list_all_pages(client, auth_headers(token), 2) == ids
+    
+    def test_get_sessions_cursor_ties_on_start_time(self, client, auth_token, auth_headers):
+        """Test that sessions sharing a start_time are neither skipped nor repeated"""
+        token = auth_token()
+        start_time = datetime.utcnow().replace(microsecond=0)
+        ids = self._add_completed_sessions([start_time] * 5)
+        
+        # Ties are ordered by id, newest first
+        assert self._list_all_pages(client, auth_headers(token), 2) == sorted(ids, reverse=True)
+    
+    def test_get_sessions_malformed_cursor(self, client, auth_token, auth_headers):
+        """Test that a malformed before cursor is rejected"""
+        token = auth_token()
+        
+        for before in ('garbage', 'not-a-date,1', '2024-01-15T10:00:00,abc'):
+            response = client.get('/api/sessions/',
+                                headers=auth_headers(token),
+                                query_string={'before': before})
+            
+            assert response.status_code == 400
+    
+    def _add_active_session(self):
+        """Insert a running session for the test user and return its id"""
+        from models.user import User
+        user = User.query.filter_by(email='test@example.com').first()
+        
+        session = StudySession(
+            user_id=user.id,
+            title='Running',
+            planned_duration=25,
+            start_time=datetime.utcnow(),
+            status='active',
+            is_active=True
+        )
+        db.session.add(session)
+        db.session.commit()
+        return session.id
+    
+    def test_create_session_loses_active_race(self, client, auth_token, auth_headers,
+                                              active_session_index, skip_first_active_check):
+        """Test that the unique index turns a racing create into a 409"""
+        token = auth_token()
+        active_id = self._add_active_session()
+        
+        response = client.post('/api/sessions/',
+                             headers=auth_headers(token),
+                             json={'title': 'Second', 'planned_duration': 25})
+        
+        assert response.status_code == 409
+        assert response.get_json()['active_session_id'] == active_id
+        assert StudySession.query.filter_by(is_active=True).count() == 1
+    
+    def test_start_session_loses_active_race(self, client, auth_token, auth_headers,
+                                             active_session_index, skip_first_active_check):
+        """Test that the unique index turns a racing start into a 409"""
+        token = auth_token()
+        active_id = self._add_active_session()
+        
+        from models.user import User
+        user = User.query.filter_by(email='test@example.com').first()
+        session = StudySession(user_id=user.id, title='Planned', planned_duration=25, is_active=False)
+        db.session.add(session)
+        db.session.commit()
+        
+        response = client.post(f'/api/sessions/{session.id}/start', headers=auth_headers(token))
+        
+        assert response.status_code == 409
+        assert response.get_json()['active_session_id'] == active_id
+        assert StudySession.query.filter_by(is_active=True).count() == 1
+    
+    def test_view_error_is_logged_and_rolled_back(self, client, auth_token, auth_headers,
+                                                  monkeypatch, caplog):
+        """Test that an unexpected view error returns the view's 500 and is logged"""
+        from sqlalchemy.exc import OperationalError
+        import routes.session_routes as session_routes
+        token = auth_token()
+        
+        def _failing_fetch(session_id, user_id):
+            raise OperationalError('SELECT', {}, Exception('database is locked'))
+        
+        monkeypatch.setattr(session_routes, '_fetch_session', _failing_fetch)
+        response = client.get('/api/sessions/1', headers=auth_headers(token))
+        
+        assert response.status_code == 500
+        assert response.get_json()['error'] == 'Failed to fetch session'
+        assert 'Unhandled error in sessions.get_session' in caplog.text
@@ -0,0 +1,128 @@
+"""
+Redis read-through cache helpers for Study Eyes application
+"""
+
+import logging
+from datetime import datetime
+import redis
+from flask import current_app
+from utils.serialization import fast_dumps, fast_loads
+
+logger = logging.getLogger(__name__)
+
+# One pool per Redis URL, shared by every request handled in this process
+_pools = {}
+
+def get_redis():
+    """Return a Redis client for the configured REDIS_URL, or None if caching is disabled"""
+    url = current_app.config.get('REDIS_URL')
+    if not url:
+        return None
+
+    pool = _pools.get(url)
+    if pool is None:
+        pool = _pools[url] = redis.ConnectionPool.from_url(url, max_connections=64)
+    return redis.Redis(connection_pool=pool)
+
+def cache_get_raw(key):
+    """Fetch a cached value's stored JSON bytes; errors and misses both return None"""
+    client = get_redis()
+    if client is None:
+        return None
+
+    try:
+        return client.get(key)
+    except redis.RedisError as e:
+        logger.warning(f"Cache read failed for {key}: {e}")
+        return None
+
+def cache_get(key):
+    """Fetch a JSON value from the cache; errors and misses both return None"""
+    cached = cache_get_raw(key)
+    return fast_loads(cached) if cached is not None else None
+
+def cache_set_raw(key, raw, ttl):
+    """Store already-serialized JSON bytes in the cache for ttl seconds"""
+    client = get_redis()
+    if client is None:
+        return
+
+    try:
+        client.setex(key, ttl, raw)
+    except redis.RedisError as e:
+        logger.warning(f"Cache write failed for {key}: {e}")
+
+def cache_set(key, value, ttl):
+    """Store a JSON-serializable value in the cache for ttl seconds"""
+    cache_set_raw(key, fast_dumps(value), ttl)
+
+def cache_delete(*keys):
+    """Drop keys from the cache"""
+    client = get_redis()
+    if client is None:
+        return
+
+    try:
+        client.delete(*keys)
+    except redis.RedisError as e:
+        logger.warning(f"Cache delete failed for {keys}: {e}")
+
+def dashboard_key(user_id, day=None):
+    """Cache key for a user's dashboard on a given day (default today)"""
+    day = day or datetime.utcnow().date()
+    return f"dashboard:{user_id}:{day.isoformat()}"
+
+def invalidate_dashboard(user_id):
+    """Drop today's cached dashboard after the user's session state changes"""
+    cache_delete(dashboard_key(user_id))
+
+def user_key(user_id):
+    """Cache key for a user's serialized profile"""
+    return f"user:{user_id}"
+
+def invalidate_user(user_id):
+    """Drop a user's cached profile after it is written"""
+    cache_delete(user_key(user_id))
+
+def revoke_token(jti, ttl):
+    """Add a token to the blocklist until it would have expired anyway"""
+    client = get_redis()
+    if client is None or ttl <= 0:
+        return
+
+    try:
+        client.setex(f"bl:{jti}", ttl, 1)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to revoke token {jti}: {e}")
+
+def is_token_revoked(jti):
+    """Check the blocklist; tokens are treated as valid when Redis is unavailable"""
+    client = get_redis()
+    if client is None:
+        return False
+
+    try:
+        return client.exists(f"bl:{jti}") > 0
+    except redis.RedisError as e:
+        logger.warning(f"Blocklist lookup failed for {jti}: {e}")
+        return False
+
+def active_session_key(user_id):
+    """Cache key for the id of a user's active session (0 when there is none)"""
+    return f"active_sess:{user_id}"
+
+def invalidate_active_session(user_id):
+    """Drop the active-session hint after a session changes state"""
+    cache_delete(active_session_key(user_id))
+
+def profile_stats_key(user_id):
+    """Cache key for a user's profile with statistics"""
+    return f"profile_stats:{user_id}"
+
+def stats_summary_key(user_id):
+    """Cache key for a user's stats summary"""
+    return f"stats_summary:{user_id}"
+
+def invalidate_user_stats(user_id):
+    """Drop a user's cached profile statistics and summary after their sessions or profile change"""
+    cache_delete(profile_stats_key(user_id), stats_summary_key(user_id))
@@ -0,0 +1,54 @@
+"""
+Fast JSON response helpers for Study Eyes application
+"""
+
+import decimal
+import json
+import uuid
+import orjson
+from flask import Response
+from flask.json.provider import JSONProvider
+
+# Naive datetimes are stored as UTC throughout the app; non-str keys are
+# stringified like the stdlib json module does
+_ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _default(obj):
+    """Fallback for types orjson does not serialize natively, matching Flask's default provider"""
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def fast_dumps(obj):
+    """Serialize obj to JSON bytes with orjson"""
+    return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+def fast_loads(s):
+    """Parse JSON with orjson, falling back to the stdlib for NaN/Infinity literals it rejects"""
+    try:
+        return orjson.loads(s)
+    except orjson.JSONDecodeError:
+        return json.loads(s)
+
+def fast_jsonify(obj, status=200):
+    """Serialize obj with orjson into a JSON response"""
+    return Response(fast_dumps(obj), status=status, mimetype='application/json')
+
+class OrjsonProvider(JSONProvider):
+    """App JSON provider backed by orjson, so every jsonify() call takes the fast path
+    
+    Unlike Flask's default provider, datetimes are written as ISO 8601 (naive ones
+    with a "+00:00" suffix) rather than HTTP dates, and keys keep insertion order.
+    """
+    
+    def dumps(self, obj, **kwargs):
+        return fast_dumps(obj).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return fast_loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(fast_dumps(obj), mimetype='application/json')